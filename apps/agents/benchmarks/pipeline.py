@@ -0,0 +1,145 @@
+"""Benchmark suite of the composer audio pipeline, without network access.
+
+Runs each stage on synthetic 48 kHz stereo fixtures of several lengths and reports, per stage and
+length: throughput in audio-seconds per CPU-second (ffmpeg children included), p50/p99 latency and
+peak RSS. Stages:
+
+    b64decode   base64 decode of a WAV sample, as returned by Lyria-002
+    from_wav    AudioSegment.from_wav
+    from_raw    AudioSegment.from_raw of the PCM
+    postprocess composer.utils.postprocess on the PCM
+    encode      convert_mp3 on the pooled ffmpeg encoders
+    save        save_artifact of the MP3 on an InMemoryArtifactService
+
+    uv run python -m benchmarks.pipeline --seconds 10 60 600 --repeat 5 --output results.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import time
+
+import numpy as np
+from google.adk.artifacts import InMemoryArtifactService
+from google.genai import types
+from pydub import AudioSegment
+
+from composer.utils.audio import CHANNELS, SAMPLE_RATE, SAMPLE_WIDTH, convert_mp3
+from composer.utils.postprocess import postprocess
+
+
+def make_fixture(seconds: int) -> dict:
+    rng = np.random.default_rng(seconds)
+    pcm = rng.normal(0, 3000, (seconds * SAMPLE_RATE, CHANNELS)).astype(np.int16).tobytes()
+    segment = AudioSegment(data=pcm, sample_width=SAMPLE_WIDTH, frame_rate=SAMPLE_RATE, channels=CHANNELS)
+    wav = io.BytesIO()
+    segment.export(wav, format="wav")
+    return {"pcm": pcm, "segment": segment, "wav": wav.getvalue(), "b64": base64.b64encode(wav.getvalue()).decode()}
+
+
+def reset_peak_rss() -> bool:
+    """Resets the peak RSS of this process, which only Linux supports."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mib() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS, and never goes down.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 2**20 if platform.system() == "Darwin" else maxrss / 1024
+
+
+def cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+async def run_stage(name: str, step, seconds: int, repeat: int) -> dict:
+    reset_peak_rss()
+    latencies = []
+    cpu_start = cpu_seconds()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await step()
+        latencies.append(time.perf_counter() - start)
+    cpu = cpu_seconds() - cpu_start
+    latencies.sort()
+    return {
+        "stage": name,
+        "audio_seconds": seconds,
+        "repeat": repeat,
+        "throughput": seconds * repeat / cpu if cpu else None,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+
+async def run(lengths: list[int], repeat: int) -> list[dict]:
+    artifacts = InMemoryArtifactService()
+    results = []
+    for seconds in lengths:
+        fixture = make_fixture(seconds)
+        mp3 = await convert_mp3(fixture["segment"])
+
+        async def b64decode():
+            base64.b64decode(fixture["b64"])
+
+        async def from_wav():
+            AudioSegment.from_wav(io.BytesIO(fixture["wav"]))
+
+        async def from_raw():
+            AudioSegment.from_raw(io.BytesIO(fixture["pcm"]), sample_width=SAMPLE_WIDTH, frame_rate=SAMPLE_RATE, channels=CHANNELS)
+
+        async def post():
+            postprocess(fixture["pcm"])
+
+        async def encode():
+            await convert_mp3(fixture["segment"])
+
+        async def save():
+            await artifacts.save_artifact(app_name="benchmark", user_id="user", session_id="session", filename=f"{seconds}",
+                                          artifact=types.Part.from_bytes(data=mp3, mime_type="audio/mp3"))
+
+        for name, step in [("b64decode", b64decode), ("from_wav", from_wav), ("from_raw", from_raw),
+                           ("postprocess", post), ("encode", encode), ("save", save)]:
+            result = await run_stage(name, step, seconds, repeat)
+            results.append(result)
+            print(f"{name:>12} {seconds:5d}s: {result['throughput'] or 0:10.1f} audio-s/cpu-s  "
+                  f"p50 {result['p50_ms']:9.1f} ms  p99 {result['p99_ms']:9.1f} ms  "
+                  f"peak RSS {result['peak_rss_mib']:7.1f} MiB")
+        del fixture
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, nargs="+", default=[10, 60, 600])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.seconds, args.repeat))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "cpus": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
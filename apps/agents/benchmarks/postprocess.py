@@ -0,0 +1,67 @@
+"""Throughput benchmark of the PCM post-processing stage.
+
+Runs each step of `composer.utils.postprocess` and the complete pipeline, in one go and streamed in
+half-second writes as LongComposerFlowAgent does, over synthetic 48 kHz stereo audio and reports the
+milliseconds spent per minute of audio.
+
+    uv run python -m benchmarks.postprocess --minutes 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from composer.utils.audio import CHANNELS, FRAME_SIZE, SAMPLE_RATE
+from composer.utils.postprocess import PostProcessing, PostProcessor, frame_peaks, limit, postprocess, to_frames, to_pcm
+
+
+def make_pcm(minutes: float) -> bytes:
+    """A second of silence around noise with a slowly varying level and a few clipped peaks."""
+    frames = int(minutes * 60 * SAMPLE_RATE)
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 0.1, (frames, CHANNELS)).astype(np.float32)
+    audio *= (0.5 + 0.5 * np.sin(np.arange(frames) / SAMPLE_RATE)).astype(np.float32)[:, None]
+    audio[::SAMPLE_RATE * 7] = 1.0
+    audio[:SAMPLE_RATE] = 0
+    audio[-SAMPLE_RATE:] = 0
+    return to_pcm(audio)
+
+
+def streamed(pcm: bytes, settings: PostProcessing) -> bytes:
+    processor = PostProcessor(settings)
+    write_size = SAMPLE_RATE // 2 * FRAME_SIZE
+    out = [processor.process(pcm[i:i + write_size]) for i in range(0, len(pcm), write_size)]
+    out.append(processor.flush())
+    return b"".join(out)
+
+
+def run(name: str, step, minutes: float, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        step()
+        timings.append(time.perf_counter() - start)
+    print(f"{name:>12}: {min(timings) / minutes * 1000:9.1f} ms per audio minute")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pcm = make_pcm(args.minutes)
+    settings = PostProcessing()
+    frames = to_frames(pcm)
+    block = int(settings.limiter_block_seconds * SAMPLE_RATE)
+
+    run("decode", lambda: to_frames(pcm), args.minutes, args.repeat)
+    run("peaks", lambda: frame_peaks(frames), args.minutes, args.repeat)
+    run("limiter", lambda: limit(frames.copy(), 0.89, block), args.minutes, args.repeat)
+    run("encode", lambda: to_pcm(frames), args.minutes, args.repeat)
+    run("one-shot", lambda: postprocess(pcm, settings), args.minutes, args.repeat)
+    run("streamed", lambda: streamed(pcm, settings), args.minutes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
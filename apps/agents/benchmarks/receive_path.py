@@ -0,0 +1,87 @@
+"""Micro-benchmark of the Lyria RealTime receive path.
+
+Replays synthetic `LiveMusicServerMessage`s through the previous receive loop (growing bytearray,
+first chunk only, busy-yield sleeps) and through the `PcmRing` path used by LongComposerFlowAgent,
+and reports chunks/sec and traced memory per minute of audio.
+
+    uv run python -m benchmarks.receive_path --minutes 3
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from google.genai import types
+
+from composer.utils.audio import FRAME_SIZE, SAMPLE_RATE
+from composer.utils.pcm import PcmRing
+
+
+def make_messages(minutes: float, chunk_ms: int, chunks_per_message: int) -> list[types.LiveMusicServerMessage]:
+    chunk = types.AudioChunk(data=bytes(SAMPLE_RATE * chunk_ms // 1000 * FRAME_SIZE), mime_type="audio/l16;rate=48000;channels=2")
+    count = int(minutes * 60 * 1000 / chunk_ms / chunks_per_message)
+    message = types.LiveMusicServerMessage(server_content=types.LiveMusicServerContent(audio_chunks=[chunk] * chunks_per_message))
+    return [message] * count
+
+
+async def previous_path(messages: list[types.LiveMusicServerMessage]) -> int:
+    audio_byte_array = bytearray()
+    for message in messages:
+        audio_byte_array.extend(message.server_content.audio_chunks[0].data)
+        await asyncio.sleep(10**-12)
+    return len(audio_byte_array)
+
+
+async def ring_path(messages: list[types.LiveMusicServerMessage]) -> int:
+    ring = PcmRing()
+    received = 0
+
+    async def receive():
+        try:
+            for message in messages:
+                for chunk in message.server_content.audio_chunks:
+                    await ring.write(memoryview(chunk.data))
+        finally:
+            ring.close()
+
+    async def consume():
+        nonlocal received
+        async for pcm in ring.chunks():
+            received += len(pcm)
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(receive())
+        tg.create_task(consume())
+    return received
+
+
+def run(name: str, path, messages: list[types.LiveMusicServerMessage], minutes: float):
+    tracemalloc.start()
+    start = time.perf_counter()
+    received = asyncio.run(path(messages))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    chunks = sum(len(m.server_content.audio_chunks) for m in messages)
+    print(
+        f"{name:>8}: {chunks / elapsed:12.0f} chunks/sec  "
+        f"{peak / minutes / 2**20:8.2f} MiB peak per audio minute  "
+        f"{received / FRAME_SIZE / SAMPLE_RATE:7.1f} s of audio kept"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=3)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--chunks-per-message", type=int, default=2)
+    args = parser.parse_args()
+
+    messages = make_messages(args.minutes, args.chunk_ms, args.chunks_per_message)
+    run("previous", previous_path, messages, args.minutes)
+    run("ring", ring_path, messages, args.minutes)
+
+
+if __name__ == "__main__":
+    main()
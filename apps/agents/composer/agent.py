@@ -1,14 +1,16 @@
-import copy
+import asyncio
 import logging
 import os
 
 from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.models import LlmResponse
+from google.adk.tools import BaseTool, ToolContext
 from google.adk.tools.agent_tool import AgentTool
 from google.genai import types
 
 from .prompts import instructions
+from .utils.artifacts import PREVIEW_ARTIFACT_KEY, artifact_reference, preview_artifact_id, use_artifact_references
 from .sub_agents.long_composer.agent import root_agent as long_composer_agent
 
 if "GOOGLE_CLOUD_AGENT_ENGINE_ID" in os.environ:
@@ -23,8 +25,8 @@ if "GOOGLE_CLOUD_AGENT_ENGINE_ID" in os.environ:
 logger = logging.getLogger(__name__)
 
 async def load_artifact(callback_context: CallbackContext, llm_response: LlmResponse) -> LlmResponse:
-
-    if not callback_context.state.get("music_artifact_list"):
+    filenames = callback_context.state.get("music_artifact_list")
+    if not filenames:
         logger.info("No music artifacts to load")
         return llm_response
 
@@ -35,27 +37,31 @@ async def load_artifact(callback_context: CallbackContext, llm_response: LlmResp
                 callback_context.state.update({"music_artifact_list": None})
                 return llm_response
 
-    parts_new = copy.deepcopy(llm_response.content.parts)
-    for filename in callback_context.state.get("music_artifact_list"):
-        logger.info(f"Loading artifact: {filename}")
+    logger.info(f"Loading artifacts: {filenames}")
+    if use_artifact_references():
+        parts_new = [artifact_reference(filename) for filename in filenames]
+    else:
+        artifacts = await asyncio.gather(*(callback_context.load_artifact(filename=filename) for filename in filenames))
+        # The loaded parts are appended as they are, the audio bytes are never copied.
+        parts_new = [artifact for artifact in artifacts if artifact is not None]
+
+    callback_context.state.update({"music_artifact_list": None})
 
-        if "GOOGLE_CLOUD_AGENT_ENGINE_ID" in os.environ:
-            parts_new.append(types.Part.from_text(text=f"<artifact>{filename}</artifact>"))
-            continue
-        else:
-            audio_artifact = await callback_context.load_artifact(filename=filename)
-            if audio_artifact is None:
-                continue
+    # Shallow copies: only the list of parts is new, the existing parts are shared with the original response.
+    content = llm_response.content or types.Content(role="model")
+    content = content.model_copy(update={"parts": [*(content.parts or []), *parts_new]})
+    return llm_response.model_copy(update={"content": content})
 
-            audio_bytes = audio_artifact.inline_data.data
-            mime_string = 'audio/mp3'
-            parts_new.append(types.Part.from_bytes(data=audio_bytes, mime_type=mime_string))
 
-    callback_context.state.update({"music_artifact_list": None})
+def name_preview(tool: BaseTool, args: dict, tool_context: ToolContext) -> None:
+    """Names the artifact the long composer saves its previews to after the id of the function call, which the
+    client gets in the function call event and polls until the response.
 
-    llm_response_new = copy.deepcopy(llm_response)
-    llm_response_new.content.parts = parts_new
-    return llm_response_new
+    AgentTool runs the composer in a session of its own and drops its events, so the previews can only reach
+    the client through the artifacts it forwards to this session.
+    """
+    if tool.name == long_composer_agent.name and long_composer_agent.preview_interval_seconds:
+        tool_context.state[PREVIEW_ARTIFACT_KEY] = preview_artifact_id(tool_context.function_call_id)
 
 
 root_agent = Agent(
@@ -64,5 +70,6 @@ root_agent = Agent(
     description='A helpful assistant for user questions.',
     instruction=instructions(),
     tools=[AgentTool(long_composer_agent)],
+    before_tool_callback=name_preview,
     after_model_callback=load_artifact
 )
@@ -13,12 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import asyncio
+import base64
 from typing import Any, AsyncIterable
 
 from google.adk.agents.run_config import StreamingMode, RunConfig
 from google.adk.artifacts import BaseArtifactService
 from vertexai.preview import reasoning_engines
 
+from composer.utils.artifacts import ARTIFACT_INDEX_KEY
+
+ARTIFACT_CHUNK_SIZE = 256 * 1024
+
 
 class CustomAdkApp(reasoning_engines.AdkApp):
     """An ADK Application."""
@@ -82,6 +88,59 @@ class CustomAdkApp(reasoning_engines.AdkApp):
         return await artifact_service.load_artifact(app_name=self._tmpl_attrs.get("app_name"), user_id=user_id,
                                                     session_id=session_id, filename=artifact_id)
 
+    async def list_artifact_versions(self, user_id: str, session_id: str, artifact_id: str, **kwargs) -> list[int]:
+        """Returns the versions of an artifact without loading it, e.g. to poll for a new preview."""
+        artifact_service: BaseArtifactService = self._tmpl_attrs["artifact_service"]
+        return await artifact_service.list_versions(app_name=self._tmpl_attrs.get("app_name"), user_id=user_id,
+                                                    session_id=session_id, filename=artifact_id)
+
+    async def load_artifacts(self, user_id: str, session_id: str, artifact_ids: list[str], **kwargs) -> dict[str, Any]:
+        """Loads several artifacts concurrently in one call, by id. Missing artifacts map to None."""
+        artifacts = await asyncio.gather(*(self.load_artifact(user_id, session_id, artifact_id) for artifact_id in artifact_ids))
+        return {artifact_id: artifact.model_dump(mode="json", exclude_none=True) if artifact else None
+                for artifact_id, artifact in zip(artifact_ids, artifacts)}
+
+    async def list_artifact_metadata(self, user_id: str, session_id: str, **kwargs) -> dict[str, Any]:
+        """Returns the metadata index of the songs in a session, by artifact id, without loading any audio.
+
+        Like `list_artifact`, an unknown session has no songs rather than being an error.
+        """
+        if not self._tmpl_attrs.get("session_service"):
+            self.set_up()
+        # async_get_session raises RuntimeError for an unknown session, the service returns None.
+        session = await self._tmpl_attrs["session_service"].get_session(
+            app_name=self._tmpl_attrs.get("app_name"), user_id=user_id, session_id=session_id)
+        if session is None:
+            return {}
+        return session.state.get(ARTIFACT_INDEX_KEY) or {}
+
+    async def stream_artifact(self, user_id: str, session_id: str, artifact_id: str, offset: int = 0,
+                              length: int | None = None, chunk_size: int = ARTIFACT_CHUNK_SIZE,
+                              **kwargs) -> AsyncIterable[dict[str, Any]]:
+        """Streams the bytes `offset` to `offset + length` of an artifact.
+
+        The first item carries the MIME type, the total size of the artifact and the range being sent,
+        the following ones a base64 chunk of at most `chunk_size` bytes each with its offset. Nothing is
+        yielded when the artifact doesn't exist. Raises ValueError for a negative `offset` or `length` or a
+        `chunk_size` that isn't positive; an `offset` past the end yields an empty range.
+        """
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError(f"invalid range offset={offset} length={length}")
+        if chunk_size <= 0:
+            raise ValueError(f"invalid chunk_size {chunk_size}")
+        artifact_service: BaseArtifactService = self._tmpl_attrs["artifact_service"]
+        artifact = await artifact_service.load_artifact(app_name=self._tmpl_attrs.get("app_name"), user_id=user_id,
+                                                        session_id=session_id, filename=artifact_id)
+        if artifact is None or artifact.inline_data is None:
+            return
+
+        data = memoryview(artifact.inline_data.data)
+        end = len(data) if length is None else min(len(data), offset + length)
+        yield {"mime_type": artifact.inline_data.mime_type, "size": len(data), "offset": offset,
+               "length": max(0, end - offset)}
+        for start in range(offset, end, chunk_size):
+            yield {"offset": start, "data": base64.b64encode(data[start:min(end, start + chunk_size)]).decode()}
+
     async def list_artifact(self, user_id: str, session_id: str, **kwargs):
         artifact_service: BaseArtifactService = self._tmpl_attrs["artifact_service"]
         return await artifact_service.list_artifact_keys(app_name=self._tmpl_attrs.get("app_name"), user_id=user_id,
@@ -102,7 +161,11 @@ class CustomAdkApp(reasoning_engines.AdkApp):
                 "async_create_session",
                 "async_delete_session",
                 "load_artifact",
+                "load_artifacts",
+                "list_artifact_versions",
+                "list_artifact",
+                "list_artifact_metadata",
             ],
             "stream": ["stream_query_sse", "stream_query", "streaming_agent_run_with_events"],
-            "async_stream": ["async_stream_query", "async_stream_query_sse"],
+            "async_stream": ["async_stream_query", "async_stream_query_sse", "stream_artifact"],
         }
@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Awaitable, Callable
+
+CACHE_DIR = os.environ.get('LYRIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'lyria-cache'))
+MEMORY_BYTES = int(os.environ.get('LYRIA_CACHE_MEMORY_MB', 256)) * 2**20
+DISK_BYTES = int(os.environ.get('LYRIA_CACHE_DISK_MB', 2048)) * 2**20
+MAX_AGE_SECONDS = float(os.environ.get('LYRIA_CACHE_MAX_AGE_SECONDS', 7 * 24 * 3600))
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(params: dict) -> str:
+    """Returns a stable hash of Lyria-002 request parameters, ignoring whitespace differences in the prompts."""
+    normalized = {k: " ".join(v.split()) if isinstance(v, str) else v for k, v in params.items() if v not in ("", None)}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+class GenerationCache:
+    """Two-tier cache of encoded generations, keyed by `cache_key`.
+
+    Recent entries are kept in an in-memory LRU bounded by `memory_bytes`. Every entry is also written
+    to `directory`, one sub-directory per key, which is bounded by `disk_bytes` and `max_age_seconds`
+    and evicted least recently used first. Concurrent requests for a key that is being generated wait
+    for that generation instead of starting their own.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, memory_bytes: int = MEMORY_BYTES, disk_bytes: int = DISK_BYTES,
+                 max_age_seconds: float = MAX_AGE_SECONDS):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self.counters = collections.Counter(hits=0, disk_hits=0, misses=0, coalesced=0)
+        self._memory: collections.OrderedDict[str, list[bytes]] = collections.OrderedDict()
+        self._memory_size = 0
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    def _remember(self, key: str, samples: list[bytes]):
+        size = sum(len(s) for s in samples)
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= sum(len(s) for s in self._memory.pop(key))
+        self._memory[key] = samples
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= sum(len(s) for s in evicted)
+
+    def _read(self, key: str) -> list[bytes] | None:
+        path = os.path.join(self.directory, key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                shutil.rmtree(path, ignore_errors=True)
+                return None
+            names = sorted(os.listdir(path), key=lambda name: int(name.split(".")[0]))
+            samples = []
+            for name in names:
+                with open(os.path.join(path, name), "rb") as f:
+                    samples.append(f.read())
+            os.utime(path)
+            return samples
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, key: str, samples: list[bytes]):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written next to the final path and renamed, so readers never see a partial entry.
+        staging = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        for index, sample in enumerate(samples):
+            with open(os.path.join(staging, f"{index}.mp3"), "wb") as f:
+                f.write(sample)
+        try:
+            os.replace(staging, os.path.join(self.directory, key))
+        except OSError:
+            # Another process stored the same key first.
+            shutil.rmtree(staging, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in entries:
+            if total <= self.disk_bytes and now - mtime <= self.max_age_seconds:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    async def _load(self, key: str, create: Callable[[], Awaitable[list[bytes]]]) -> list[bytes]:
+        samples = await asyncio.to_thread(self._read, key)
+        if samples is not None:
+            self.counters["disk_hits"] += 1
+        else:
+            self.counters["misses"] += 1
+            samples = await create()
+            try:
+                await asyncio.to_thread(self._write, key, samples)
+            except OSError as e:
+                logger.warning(f"failed to store generation {key} on disk: {e}")
+        self._remember(key, samples)
+        return samples
+
+    def _loaded(self, key: str, task: asyncio.Task):
+        del self._in_flight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Waiters get the exception, this only keeps it from being reported as never retrieved.
+            logger.warning(f"failed to create generation {key}: {task.exception()}")
+        logger.info(f"generation cache {dict(self.counters)}")
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[list[bytes]]]) -> list[bytes]:
+        """Returns the cached samples for `key`, calling `create` on a miss.
+
+        The load runs in a task of the cache that every caller waits for, so a cancelled caller neither
+        cancels it for the others nor wastes the generation.
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.counters["hits"] += 1
+            return self._memory[key]
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = self._in_flight[key] = asyncio.create_task(self._load(key, create))
+            task.add_done_callback(lambda _: self._loaded(key, task))
+        return await asyncio.shield(task)
+
+
+generation_cache = GenerationCache()
@@ -0,0 +1,125 @@
+import asyncio
+import functools
+import logging
+import os
+
+import google.auth
+from google.auth.credentials import Credentials
+from google.cloud import aiplatform
+from google.protobuf import json_format
+from google.protobuf.struct_pb2 import Value
+
+API_ENDPOINT = 'aiplatform.googleapis.com'
+LOCATION = 'us-central1'
+MODEL = 'lyria-002'
+MAX_CONCURRENT_PREDICTS = int(os.environ.get('LYRIA_MAX_CONCURRENT_PREDICTS', 8))
+# Requests arriving within this window are sent as one multi-instance predict. 0 disables batching.
+BATCH_WINDOW_SECONDS = float(os.environ.get('LYRIA_BATCH_WINDOW_MS', 0)) / 1000
+MAX_BATCH_SIZE = int(os.environ.get('LYRIA_MAX_BATCH_SIZE', 4))
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def default_credentials() -> tuple[Credentials, str]:
+    """Returns the application default credentials and project, resolved once per process."""
+    return google.auth.default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+
+
+class LyriaPredictClient:
+    """Shared async client for Lyria-002 predictions.
+
+    The gRPC channel is created lazily on first use and reused by every call on the same event loop, with
+    the credentials cached across calls. At most `max_concurrency` predicts are in flight at once, the
+    others wait for a slot without blocking the loop.
+
+    With a `batch_window`, `generate` collects the instances requested within the window, up to
+    `max_batch_size`, into a single predict and hands each caller the predictions of its own instance.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_PREDICTS, location: str = LOCATION, model: str = MODEL,
+                 batch_window: float = BATCH_WINDOW_SECONDS, max_batch_size: int = MAX_BATCH_SIZE):
+        self.max_concurrency = max_concurrency
+        self.location = location
+        self.model = model
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._batch: list[tuple[dict, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._batches: set[asyncio.Task] = set()
+        self._client: aiplatform.gapic.PredictionServiceAsyncClient | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._endpoint = ''
+
+    async def _connect(self) -> aiplatform.gapic.PredictionServiceAsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return self._client
+        # google.auth.default() may query the metadata server, so the first call runs it off the loop.
+        credentials, project_id = await asyncio.to_thread(default_credentials)
+        if self._loop is not loop:
+            # The channel is bound to the loop it was created on, so a new loop gets its own client.
+            self._client = aiplatform.gapic.PredictionServiceAsyncClient(
+                credentials=credentials, client_options={"api_endpoint": API_ENDPOINT})
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._endpoint = f"projects/{project_id}/locations/{self.location}/publishers/google/models/{self.model}"
+            self._loop = loop
+            logger.info(f"created prediction client for {self._endpoint}")
+        return self._client
+
+    async def predict(self, instances: list[dict], parameters: dict | None = None) -> list:
+        """Sends one predict request and returns its predictions."""
+        client = await self._connect()
+        async with self._slots:
+            response = await client.predict(
+                endpoint=self._endpoint,
+                instances=[json_format.ParseDict(instance, Value()) for instance in instances],
+                parameters=json_format.ParseDict(parameters or {}, Value()),
+            )
+        return list(response.predictions)
+
+    async def generate(self, instance: dict) -> list:
+        """Predicts a single instance, batched with concurrent callers when batching is enabled."""
+        if not self.batch_window or self.max_batch_size <= 1:
+            return await self.predict([instance])
+
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((instance, future))
+        if len(self._batch) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        task = asyncio.create_task(self._predict_batch(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _predict_batch(self, batch: list[tuple[dict, asyncio.Future]]):
+        logger.info(f"predict a batch of {len(batch)} instances")
+        try:
+            predictions = await self.predict([instance for instance, _ in batch])
+            # Predictions come back in instance order, `sample_count` of them per instance.
+            counts = [instance.get("sample_count", 1) for instance, _ in batch]
+            if len(predictions) != sum(counts):
+                raise RuntimeError(f"expected {sum(counts)} predictions for the batch, got {len(predictions)}")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for (_, future), count in zip(batch, counts):
+            if not future.done():
+                future.set_result(predictions[offset:offset + count])
+            offset += count
+
+
+lyria = LyriaPredictClient()
@@ -1,20 +1,55 @@
+import asyncio
 import base64
 import io
 import logging
+import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-import google.auth
 from google.adk.tools import ToolContext
-from google.cloud import aiplatform
 from google.genai import types
-from google.protobuf import json_format
-from google.protobuf.struct_pb2 import Value
 from pydub import AudioSegment
 
+from composer.utils.artifacts import index_artifact
 from composer.utils.audio import convert_mp3
+from composer.utils.postprocess import postprocess_segment
+from .cache import cache_key, generation_cache
+from .lyria import lyria
+
+TRANSCODE_WORKERS = int(os.environ.get('LYRIA_TRANSCODE_WORKERS', 4))
 
 loggger = logging.getLogger(__name__)
 
+# Threads rather than processes: numpy releases the GIL and the encode runs in a pooled ffmpeg process,
+# and forking would copy the gRPC channels of the prediction client.
+transcode_pool = ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix="transcode")
+
+
+def decode_sample(bytes_b64: str) -> AudioSegment:
+    """Decodes a base64 WAV sample from Lyria-002 and post-processes it."""
+    return postprocess_segment(AudioSegment.from_wav(io.BytesIO(base64.b64decode(bytes_b64))))
+
+
+async def transcode_sample(bytes_b64: str) -> bytes:
+    audio_segment = await asyncio.get_running_loop().run_in_executor(transcode_pool, decode_sample, bytes_b64)
+    return await convert_mp3(audio_segment)
+
+
+async def generate_samples(params: dict) -> list[bytes]:
+    """Runs a Lyria-002 prediction and returns its samples encoded to MP3."""
+    predictions = await lyria.generate(params)
+    loggger.info(f"Returned {len(predictions)} samples")
+    return list(await asyncio.gather(*(transcode_sample(dict(pred)["bytesBase64Encoded"]) for pred in predictions)))
+
+
+async def save_sample(mp3bytes: bytes, tool_context: ToolContext) -> str:
+    part = types.Part.from_bytes(data=mp3bytes, mime_type="audio/mp3")
+    artifact_id = uuid.uuid4().hex
+    await tool_context.save_artifact(artifact_id, part)
+    index_artifact(tool_context.state, artifact_id, part)
+    return artifact_id
+
+
 async def generate_music_tool(prompt: str, negative_prompt: str, seed: int, sample_count: int, tool_context: ToolContext):
     """
     Generates music based on the provided prompts by utilizing Google's AI
@@ -37,9 +72,6 @@ async def generate_music_tool(prompt: str, negative_prompt: str, seed: int, samp
     """
 
     try:
-        client_options = {"api_endpoint": "aiplatform.googleapis.com"}
-        client = aiplatform.gapic.PredictionServiceClient(client_options=client_options)
-
         params: dict[str, str|int] = {"prompt": prompt}
 
         if negative_prompt:
@@ -53,32 +85,13 @@ async def generate_music_tool(prompt: str, negative_prompt: str, seed: int, samp
 
         loggger.info(f"Generate music params: {params}")
 
-        instance = json_format.ParseDict(params, Value())
-        instances = [instance]
-
-        parameters_dict = {}
-        parameters = json_format.ParseDict(parameters_dict, Value())
-
-        _, project_id = google.auth.default()
-
-        endpoint_path = f"projects/{project_id}/locations/us-central1/publishers/google/models/lyria-002"
-        loggger.info(f"endpoint path {endpoint_path}")
-
-        response = client.predict(endpoint=endpoint_path, instances=instances, parameters=parameters)
-        predictions = response.predictions
-        loggger.info(f"Returned {len(predictions)} samples")
-
-        mp3_list = []
-        for index, pred in enumerate(predictions):
-            bytes_b64 = dict(pred)["bytesBase64Encoded"]
-            decoded_audio_data = base64.b64decode(bytes_b64)
-            audio_segment = AudioSegment.from_wav(io.BytesIO(decoded_audio_data))
+        if "seed" in params:
+            # A seeded request always generates the same samples.
+            samples = await generation_cache.get_or_create(cache_key(params), lambda: generate_samples(params))
+        else:
+            samples = await generate_samples(params)
 
-            mp3bytes = convert_mp3(audio_segment)
-            part = types.Part.from_bytes(data=mp3bytes, mime_type="audio/mp3")
-            artifact_id = uuid.uuid4().hex
-            await tool_context.save_artifact(artifact_id, part)
-            mp3_list.append(artifact_id)
+        mp3_list = list(await asyncio.gather(*(save_sample(sample, tool_context) for sample in samples)))
 
         tool_context.state.update({"music_artifact_list": mp3_list})
 
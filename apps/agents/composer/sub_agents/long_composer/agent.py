@@ -1,34 +1,36 @@
 import asyncio
-import io
 import logging
 import os
 import uuid
 from typing import AsyncGenerator
 
-import websockets
-from google import genai
 from google.adk import Agent
 from google.adk.agents import BaseAgent, SequentialAgent
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.events import Event, EventActions
 from google.adk.planners import BuiltInPlanner
 from google.genai import types
-from google.genai.live_music import AsyncMusicSession
-from pydub import AudioSegment
 
 from composer.schema.music_plan import MusicPlan
-from composer.utils.audio import convert_mp3
+from composer.utils.artifacts import (
+    ARTIFACT_INDEX_KEY, PREVIEW_ARTIFACT_KEY, artifact_reference, index_artifact, use_artifact_references,
+)
+from composer.utils.audio import FRAME_SIZE, SAMPLE_RATE, encoders
+from composer.utils.postprocess import PostProcessing, PostProcessor
+from composer.utils.pcm import SPILL_THRESHOLD, PcmRing, SpillingPcmBuffer
 from .prompts import instructions
+from .render import MAX_RESUMES, RESUME_CROSSFADE_FRAMES, CrossfadeStitcher, StanzaRenderer, split_stanzas
+from .session_pool import music_sessions
+from .transition import CONTROL_RATE, TRANSITION_SECONDS, PromptTransition
 from dotenv import load_dotenv
 
 load_dotenv()
 
-API_KEY = os.environ.get('GEMINI_API_KEY')
+logger = logging.getLogger(__name__)
 
-BUFFER_SECONDS=1
-MODEL='models/lyria-realtime-exp'
+# Seconds of rendered audio between two previews, 0 disables them.
+PREVIEW_SECONDS = float(os.environ.get('LONG_COMPOSER_PREVIEW_SECONDS', 0))
 
-logger = logging.getLogger(__name__)
 
 class LongComposerAgent(Agent):
 
@@ -63,23 +65,64 @@ Read data from session state with key 'music_plan_raw' and format'
         )
 
 class LongComposerFlowAgent(BaseAgent):
+    align_stanzas_to_bars: bool = False
+    """Round each stanza length to whole bars at its bpm so section changes land on a downbeat."""
+    preview_interval_seconds: float | None = PREVIEW_SECONDS or None
+    """When set, save the audio rendered so far every this many seconds of audio.
+
+    The preview goes to the artifact named in the session state under `PREVIEW_ARTIFACT_KEY`, which the
+    client polls, since `AgentTool` doesn't forward the events of the agent. Without it the preview is a new
+    version of the song's artifact, announced by a partial event.
+    """
+    render_groups: int = 1
+    """Number of groups the plan is split into and rendered on concurrent sessions, then stitched together."""
+    crossfade_seconds: float = 2.0
+    """Length of the crossfade at the seams between render groups."""
+    transition_seconds: float = TRANSITION_SECONDS
+    """Length of the prompt weight cross-fade into each stanza. 0 switches prompts at the stanza boundary."""
+    transition_control_rate: float = CONTROL_RATE
+    """Prompt weight updates sent per second during a transition."""
+    max_resumes: int = MAX_RESUMES
+    """How many times a render resumes on a new session after its connection dropped."""
+    resume_crossfade_seconds: float = RESUME_CROSSFADE_FRAMES / SAMPLE_RATE
+    """Length of the crossfade between the audio received before and after a resume."""
+    spill_threshold_bytes: int = SPILL_THRESHOLD
+    """PCM of a buffered render group beyond this size is spilled to a temp file instead of kept in memory."""
+    postprocessing: PostProcessing | None = PostProcessing()
+    """Silence trim, fades and limiter applied while encoding. None encodes the audio as received.
+
+    The render is encoded as it streams in, before its level is known, so it isn't normalized.
+    """
 
     async def _run_async_impl(
       self, ctx: InvocationContext
   ) -> AsyncGenerator[Event, None]:
+        # Connect to Lyria RealTime while the plan is being written.
+        music_sessions.prewarm(self.render_groups)
+
         agent = SequentialAgent(name="ComposerFlowAgent", sub_agents=[LongComposerAgent(), MusicPlanFormatAgent()])
         async for event in agent.run_async(ctx):
             yield event
 
-        results = await self.generate_music(ctx)
+        previews: asyncio.Queue[Event | None] = asyncio.Queue()
+        generation = asyncio.create_task(self.generate_music(ctx, previews))
+        generation.add_done_callback(lambda _: previews.put_nowait(None))
+        try:
+            while (preview := await previews.get()) is not None:
+                yield preview
+            results, version = await generation
+        finally:
+            generation.cancel()
 
         music_artifact_list = ctx.session.state.get('music_artifact_list')
 
         artifact_delta = {}
         for artifact_id in music_artifact_list:
-            artifact_delta[artifact_id] = 0
+            artifact_delta[artifact_id] = version
 
-        event_actions = EventActions(state_delta={"music_artifact_list": ctx.session.state.get('music_artifact_list')}, artifact_delta=artifact_delta)
+        event_actions = EventActions(state_delta={"music_artifact_list": ctx.session.state.get('music_artifact_list'),
+                                                  ARTIFACT_INDEX_KEY: ctx.session.state.get(ARTIFACT_INDEX_KEY)},
+                                     artifact_delta=artifact_delta)
 
         yield Event(
             invocation_id=ctx.invocation_id,
@@ -91,90 +134,117 @@ class LongComposerFlowAgent(BaseAgent):
         )
 
 
-    async def generate_music(self, ctx: InvocationContext) -> types.Content | None:
-
-        client = genai.Client(vertexai=False, api_key=API_KEY, http_options={'api_version': 'v1alpha'})
+    async def generate_music(self, ctx: InvocationContext, previews: asyncio.Queue | None = None) -> tuple[types.Content, int]:
 
         music_plan_dict: dict = ctx.session.state.get('music_plan')
         music_plan = MusicPlan.model_validate(music_plan_dict)
 
-        initial = True
-        audio_byte_array = bytearray()
-        async def receive_audio(session: AsyncMusicSession):
-            """Example background task to process incoming audio."""
+        artifact_id = uuid.uuid4().hex
+        preview_id = ctx.session.state.get(PREVIEW_ARTIFACT_KEY)
+        ring = PcmRing()
+
+        groups = split_stanzas(music_plan.stanzas, self.render_groups)
+        crossfade_frames = int(self.crossfade_seconds * SAMPLE_RATE) if len(groups) > 1 else 0
+        stitcher = CrossfadeStitcher(ring.write, crossfade_frames)
+        transition = PromptTransition(self.transition_seconds, self.transition_control_rate) if self.transition_seconds else None
+
+        # The first group streams straight into the encoder, later groups are buffered until their turn.
+        buffers = [SpillingPcmBuffer(self.spill_threshold_bytes) for _ in groups[1:]]
+        options = dict(align_to_bars=self.align_stanzas_to_bars, transition=transition, max_resumes=self.max_resumes,
+                       resume_crossfade_frames=int(self.resume_crossfade_seconds * SAMPLE_RATE))
+        renderers = [StanzaRenderer(music_sessions, groups[0], stitcher.write, **options)]
+        for group, buffer in zip(groups[1:], buffers):
+            renderers.append(StanzaRenderer(music_sessions, group, buffer.write, lead_in_frames=crossfade_frames, **options))
+        logger.info(f"render {len(groups)} groups of {[sum(s.seconds for s in g) for g in groups]} seconds")
+
+        async def stitch_audio(renders: list[asyncio.Task]):
+            try:
+                await renders[0]
+                for render, buffer in zip(renders[1:], buffers):
+                    await render
+                    stitcher.next_segment()
+                    with buffer.view() as pcm:
+                        await stitcher.write(pcm)
+                    buffer.close()
+                await stitcher.close()
+            finally:
+                ring.close()
+                for buffer in buffers:
+                    buffer.close()
+
+        preview_task = None
+
+        async def encode_audio():
+            nonlocal preview_task
+            preview_frames = int((self.preview_interval_seconds or 0) * SAMPLE_RATE)
+            encoded_frames = 0
+            processor = PostProcessor(self.postprocessing) if self.postprocessing else None
+            async for pcm in ring.chunks():
+                if processor:
+                    pcm = processor.process(pcm)
+                await encoder.write(pcm)
+                encoded_frames += len(pcm) // FRAME_SIZE
+                if not preview_frames or (previews is None and not preview_id) or encoded_frames < preview_frames:
+                    continue
+                encoded_frames = 0
+                # Skip this preview when the previous one is still being saved.
+                if preview_task is None or preview_task.done():
+                    preview_task = tg.create_task(self.save_preview(ctx, preview_id or artifact_id, encoder.encoded,
+                                                                    None if preview_id else previews))
+            if processor:
+                await encoder.write(processor.flush())
+
+        # Acquired only here so that nothing raised while setting up the render can leak the ffmpeg process.
+        async with await encoders.acquire("mp3") as encoder:
+            async with asyncio.TaskGroup() as tg:
+                renders = [tg.create_task(renderer.render()) for renderer in renderers]
+                tg.create_task(stitch_audio(renders))
+                tg.create_task(encode_audio())
+
+            # The render and encode tasks have finished here, so the encoder only needs to flush its last frames.
+            logger.info("save audio")
+            mp3_bytes = await encoder.finish()
+
+        saved = await self.save_audio(ctx, artifact_id, mp3_bytes)
+        if preview_id and preview_task is not None:
+            # The song replaces the preview, which was only kept for the client to poll.
+            await ctx.artifact_service.delete_artifact(app_name=ctx.app_name, user_id=ctx.user_id, session_id=ctx.session.id, filename=preview_id)
+        return saved
+
+
+    async def save_preview(self, ctx: InvocationContext, artifact_id: str, mp3_bytes: bytes, previews: asyncio.Queue | None):
+        """Saves the audio rendered so far as a new version of the artifact and queues a partial event for it, if
+        there is a queue."""
+        part = types.Part.from_bytes(data=mp3_bytes, mime_type="audio/mp3")
+        version = await ctx.artifact_service.save_artifact(app_name=ctx.app_name, user_id=ctx.user_id, session_id=ctx.session.id, filename=artifact_id, artifact=part)
+        logger.info(f"saved preview {artifact_id} version {version}")
+        if previews is None:
+            return
+
+        if use_artifact_references():
+            part = artifact_reference(artifact_id, tag="preview")
+
+        previews.put_nowait(Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            content=types.Content(parts=[part], role="model"),
+            partial=True,
+            branch=ctx.branch,
+        ))
 
-            chunks_count = 0
-            logger.info("start receive music")
 
-            try:
-                async for message in session.receive():
-                    chunks_count += 1
-                    if chunks_count == 1:
-                        # Introduce a delay before starting playback to have a buffer for network jitter.
-                        await asyncio.sleep(BUFFER_SECONDS)
-
-                    if message.server_content:
-                        audio_data = message.server_content.audio_chunks[0].data
-                        audio_byte_array.extend(audio_data)
-                    elif message.filtered_prompt:
-                        logger.info(f"Prompt was filtered out: {message.filtered_prompt}")
-                    else:
-                        logger.info(f"Unknown error occured with message: {message}")
-
-                    await asyncio.sleep(10**-12)
-            except websockets.exceptions.ConnectionClosedOK:
-                # nothing to do
-                pass
-            except Exception as e:
-                logger.exception(f"got error {e}")
-
-        prev_config = None
-        async with (
-            asyncio.TaskGroup() as tg,
-            client.aio.live.music.connect(model="models/lyria-realtime-exp") as session,
-        ):
-            # Set up task to receive server messages.
-            tg.create_task(receive_audio(session))
-            for stanza in music_plan.stanzas:
-                logger.info(f"next stanza {stanza}")
-                # Send initial prompts and config
-                await session.set_weighted_prompts(prompts=stanza.to_gemini_prompts())
-                if prev_config != stanza.config:
-                    logger.info(f"set music config {stanza.config}")
-                    await session.set_music_generation_config(config=stanza.to_gemini_config())
-                    if prev_config and (prev_config.scale != stanza.config.scale or prev_config.bpm != stanza.config.bpm):
-                        await session.reset_context()
-
-                prev_config = stanza.config
-                if initial:
-                    # Start streaming music
-                    logger.info("start session")
-                    await session.play()
-                    initial = False
-                logger.info(f"sleep {stanza.seconds}")
-                await asyncio.sleep(stanza.seconds)
-
-            logger.info("session stop")
-            await session.pause()
-
-        logger.info("save audio")
-        return await self.save_audio(ctx, audio_byte_array)
-
-
-    async def save_audio(self, ctx: InvocationContext, audio_byte_array: bytearray) -> types.Content:
-        audio_segment = AudioSegment.from_raw(io.BytesIO(audio_byte_array), sample_width=2, frame_rate=48000, channels=2)
-
-        part = types.Part.from_bytes(data=convert_mp3(audio_segment), mime_type="audio/mp3")
+    async def save_audio(self, ctx: InvocationContext, artifact_id: str, mp3_bytes: bytes) -> tuple[types.Content, int]:
+        part = types.Part.from_bytes(data=mp3_bytes, mime_type="audio/mp3")
 
-        artifact_id = uuid.uuid4().hex
-        await ctx.artifact_service.save_artifact(app_name=ctx.app_name, user_id=ctx.user_id, session_id=ctx.session.id, filename=artifact_id, artifact=part)
+        version = await ctx.artifact_service.save_artifact(app_name=ctx.app_name, user_id=ctx.user_id, session_id=ctx.session.id, filename=artifact_id, artifact=part)
 
         ctx.session.state.update({"music_artifact_list": [artifact_id]})
+        index_artifact(ctx.session.state, artifact_id, part)
 
-        if "GOOGLE_CLOUD_AGENT_ENGINE_ID" in os.environ:
-            return types.Content(parts=[types.Part.from_text(text=f"<artifact>{artifact_id}</artifact>")], role="model")
+        if use_artifact_references():
+            return types.Content(parts=[artifact_reference(artifact_id)], role="model"), version
 
-        return types.Content(parts=[part], role="model")
+        return types.Content(parts=[part], role="model"), version
 
 
 root_agent = LongComposerFlowAgent(name="LongComposerFlowAgent")
@@ -21,7 +21,8 @@ Your task is to:
         - about Instruments, reference "### Prompt Guide for Lyria RealTime".
         - When instruments change each stanza, 
     4. Make stanzas.
-        - Note that the model transitions can be a bit abrupt when drastically changing the prompts so it's recommended to implement some kind of cross-fading by sending intermediate weight values to the model.
+        - Each stanza is one musical section (intro, verse, drop, breakdown, outro, ...).
+        - The transition into each stanza is cross-faded automatically by gradually changing the prompt weights, so don't add transition stanzas with intermediate weight values.
 4. Save the parameters to the session state with `music_plan` key
 
 [Output Format]
@@ -108,24 +109,12 @@ The model can guide the notes that are played, but it doesn't distinguish betwee
 
 ### Stanza
 
-There should be no abrupt changes in prompts between stanzas.
+Each stanza is one musical section. When moving to the next stanza, its prompts are cross-faded in automatically over a few seconds by gradually changing the weights,
+so don't create short transition stanzas with intermediate weight values.
 
 Output Example
 <Bad Example>
-There are abrupt changes between stanzas.
-
-
-{"title": "test", "stanzas" [
-{
-"prompts": [{"text": "deep house", "weight": 1}, {"text": "808 beat", "weight": 1}], seconds: 30
-},
-{
-"prompts": [{"text": "hip hop", "weight": 1}, {"text": "Buchla Synths", "weight": 1}], seconds: 30
-},
-]}
-</Bad Example>
-<Good Example>
-If you want to change it, change the weight parameter gradually for small reasons and crossfade
+There are transition stanzas with intermediate weights.
 
 {"title": "test", "stanzas" [
 {
@@ -135,10 +124,7 @@ If you want to change it, change the weight parameter gradually for small reason
 "prompts": [{"text": "deep house", "weight": 0.8}, {"text": "808 beat", "weight": 0.8}, {"text": "hip hop", "weight": 0.2}, {"text": "Buchla Synths", "weight": 0.2}], seconds: 5 
 }, 
 { 
-"prompts": [{"text": "deep house", "weight": 0.6}, {"text": "808 beat", "weight": 0.6}, {"text": "hip hop", "weight": 0.4}, {"text": "Buchla Synths", "weight": 0.4}], seconds: 5 
-}, 
-{ 
-"prompts": [{"text": "deep house", "weight": 0.4}, {"text": "808 beat", "weight": 0.4}, {"text": "hip hop", "weight": 0.6}, {"text": "Buchla Synths", "weight": 0.6}], seconds: 5 
+"prompts": [{"text": "deep house", "weight": 0.5}, {"text": "808 beat", "weight": 0.5}, {"text": "hip hop", "weight": 0.5}, {"text": "Buchla Synths", "weight": 0.5}], seconds: 5 
 }, 
 { 
 "prompts": [{"text": "deep house", "weight": 0.2}, {"text": "808 beat", "weight": 0.2}, {"text": "hip hop", "weight": 0.8}, {"text": "Buchla Synths", "weight": 0.8}], seconds: 5 
@@ -147,6 +133,18 @@ If you want to change it, change the weight parameter gradually for small reason
 "prompts": [{"text": "hip hop", "weight": 1}, {"text": "Buchla Synths", "weight": 1}], seconds: 20 
 },
 ]}
+</Bad Example>
+<Good Example>
+Only the musical sections, the transition between them is cross-faded automatically.
+
+{"title": "test", "stanzas" [
+{
+"prompts": [{"text": "deep house", "weight": 1}, {"text": "808 beat", "weight": 1}], seconds: 30
+},
+{
+"prompts": [{"text": "hip hop", "weight": 1}, {"text": "Buchla Synths", "weight": 1}], seconds: 30
+},
+]}
 </Good Example>
 
 # Key Points
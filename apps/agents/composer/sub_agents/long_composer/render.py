@@ -0,0 +1,241 @@
+import asyncio
+import dataclasses
+import logging
+import os
+from typing import Awaitable, Callable
+
+import websockets
+from google.genai.live_music import AsyncMusicSession
+
+from composer.schema.music_plan import MusicStanza
+from composer.utils.audio import FRAME_SIZE, SAMPLE_RATE
+from composer.utils.pcm import crossfade
+from .scheduler import StanzaScheduler
+from .session_pool import MusicSessionPool
+from .transition import PromptTransition
+
+MAX_SESSIONS = int(os.environ.get('LYRIA_MAX_SESSIONS', 8))
+MAX_RESUMES = 3
+RESUME_CROSSFADE_FRAMES = SAMPLE_RATE // 2
+# Errors of a dropped or failed connection, after which a render resumes on a new session.
+RESUMABLE_ERRORS = (websockets.exceptions.WebSocketException, OSError)
+
+logger = logging.getLogger(__name__)
+
+PcmSink = Callable[[memoryview], Awaitable[None]]
+
+# Bounds the number of Lyria RealTime sessions open at once in this process.
+session_slots = asyncio.Semaphore(MAX_SESSIONS)
+
+
+def split_stanzas(stanzas: list[MusicStanza], groups: int) -> list[list[MusicStanza]]:
+    """Splits stanzas into at most `groups` consecutive runs of roughly equal length."""
+    total = sum(s.seconds for s in stanzas)
+    target = total / max(1, groups)
+    result: list[list[MusicStanza]] = [[]]
+    elapsed = 0
+    for stanza in stanzas:
+        if result[-1] and len(result) < groups and elapsed + stanza.seconds / 2 > target * len(result):
+            result.append([])
+        result[-1].append(stanza)
+        elapsed += stanza.seconds
+    return result
+
+
+@dataclasses.dataclass
+class Checkpoint:
+    """Position of an interrupted render. The PCM received so far is already in the sink, except for
+    the held back tail that the resumed audio is cross-faded with."""
+    stanza_index: int
+    frame_offset: int
+
+
+class StanzaRenderer:
+    """Renders a run of stanzas on one Lyria RealTime session and writes the PCM to `sink`.
+
+    `lead_in_frames` extends the first stanza, which gives a later group audio to crossfade with the
+    end of the group before it. With a `transition`, prompts are cross-faded into each following stanza
+    instead of being switched at its first frame.
+
+    When the session drops, the render resumes from a checkpoint on a new session up to `max_resumes`
+    times: the current stanza's prompts and config are re-applied and the new audio is cross-faded over
+    the last `resume_crossfade_frames` received. Past that, the render fails rather than end short.
+    """
+
+    def __init__(self, sessions: MusicSessionPool, stanzas: list[MusicStanza], sink: PcmSink, align_to_bars: bool = False,
+                 lead_in_frames: int = 0, transition: PromptTransition | None = None, max_resumes: int = MAX_RESUMES,
+                 resume_crossfade_frames: int = RESUME_CROSSFADE_FRAMES):
+        self.sessions = sessions
+        self.stanzas = stanzas
+        self.transition = transition
+        self.max_resumes = max_resumes
+        self.scheduler = StanzaScheduler(stanzas, align_to_bars=align_to_bars, lead_in_frames=lead_in_frames)
+        self.stitcher = CrossfadeStitcher(sink, resume_crossfade_frames)
+
+    def checkpoint(self) -> Checkpoint:
+        frame_offset = self.scheduler.received_frames
+        return Checkpoint(stanza_index=self.scheduler.stanza_at(frame_offset), frame_offset=frame_offset)
+
+    async def receive_audio(self, session: AsyncMusicSession):
+        """Background task handing incoming audio to the sink."""
+
+        logger.info("start receive music")
+
+        try:
+            async for message in session.receive():
+                if message.server_content:
+                    for chunk in message.server_content.audio_chunks or []:
+                        # Drop anything generated past the requested length of the stanzas.
+                        audio_data = memoryview(chunk.data)[:self.scheduler.remaining_frames * FRAME_SIZE]
+                        if audio_data:
+                            await self.stitcher.write(audio_data)
+                            self.scheduler.advance(len(audio_data) // FRAME_SIZE)
+                elif message.filtered_prompt:
+                    logger.info(f"Prompt was filtered out: {message.filtered_prompt}")
+                else:
+                    logger.info(f"Unknown error occured with message: {message}")
+        except websockets.exceptions.ConnectionClosedOK:
+            # nothing to do
+            pass
+
+    async def play(self, session: AsyncMusicSession, start_index: int):
+        """Sends prompts and config from the stanza at `start_index` on and stops once all frames arrived."""
+        prev_config = None
+        scheduler = self.scheduler
+        for index in range(start_index, len(self.stanzas)):
+            stanza = self.stanzas[index]
+            logger.info(f"next stanza {stanza}")
+            # Send initial prompts and config
+            ramp = index > 0 and self.transition is not None
+            sent_step = 0
+            if ramp and index == start_index:
+                sent_step, prompts = self.transition.prompts_at(scheduler, index, self.stanzas[index - 1], stanza)
+                await session.set_weighted_prompts(prompts=prompts)
+            elif not ramp:
+                await session.set_weighted_prompts(prompts=stanza.to_gemini_prompts())
+            if prev_config != stanza.config:
+                logger.info(f"set music config {stanza.config}")
+                await session.set_music_generation_config(config=stanza.to_gemini_config())
+                if prev_config and (prev_config.scale != stanza.config.scale or prev_config.bpm != stanza.config.bpm):
+                    await session.reset_context()
+
+            prev_config = stanza.config
+            if index == start_index:
+                # Start streaming music
+                logger.info("start session")
+                await session.play()
+            if ramp:
+                await self.transition.run(session, scheduler, index, self.stanzas[index - 1], stanza, sent_step)
+            logger.info(f"wait until frame {scheduler.boundaries[index]}")
+            await scheduler.wait_for_stanza(index)
+
+        logger.info("session stop")
+        await session.pause()
+
+    async def render(self):
+        start_index = 0
+        resumes = 0
+        while True:
+            error = None
+            try:
+                async with session_slots, self.sessions.session() as session:
+                    receive = asyncio.create_task(self.receive_audio(session))
+                    play = asyncio.create_task(self.play(session, start_index))
+                    try:
+                        await asyncio.wait({receive, play}, return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        receive.cancel()
+                        play.cancel()
+                        results = await asyncio.gather(receive, play, return_exceptions=True)
+                error = next((r for r in results if isinstance(r, Exception)), None)
+            except RESUMABLE_ERRORS as e:
+                # The new session failed to connect, which counts as another interruption.
+                error = e
+
+            if error is not None and not isinstance(error, RESUMABLE_ERRORS):
+                raise error
+            if not self.scheduler.remaining_frames:
+                break
+
+            checkpoint = self.checkpoint()
+            if resumes >= self.max_resumes:
+                # A song cut short must not be saved as if it were complete.
+                self.scheduler.close()
+                raise RuntimeError(f"gave up on the music session at {checkpoint} after {resumes} resumes, "
+                                   f"{self.scheduler.remaining_frames} frames short") from error
+            resumes += 1
+            logger.warning(f"music session interrupted at {checkpoint}, resuming ({resumes}/{self.max_resumes}): {error!r}")
+            # The first frames of the new session are mixed into the held back tail instead of adding to it.
+            self.scheduler.rewind(self.stitcher.next_segment())
+            start_index = self.checkpoint().stanza_index
+
+        await self.stitcher.close()
+        self.scheduler.close()
+
+
+class CrossfadeStitcher:
+    """Writes consecutive PCM segments to a sink, overlapping each seam by `crossfade_frames`.
+
+    The last `crossfade_frames` of the current segment are held back until the next segment starts or
+    the stitcher is closed.
+    """
+
+    def __init__(self, sink: PcmSink, crossfade_frames: int):
+        self.sink = sink
+        self.crossfade_bytes = crossfade_frames * FRAME_SIZE
+        self._tail = bytearray()
+        self._head = bytearray()
+        self._seam_bytes = 0
+
+    async def write(self, data: bytes | memoryview):
+        if not self.crossfade_bytes:
+            await self.sink(memoryview(data))
+            return
+
+        data = memoryview(data)
+        if self._seam_bytes:
+            needed = self._seam_bytes - len(self._head)
+            self._head.extend(data[:needed])
+            data = data[needed:]
+            if len(self._head) < self._seam_bytes:
+                return
+            self._tail[-self._seam_bytes:] = crossfade(self._tail[-self._seam_bytes:], self._head)
+            self._head.clear()
+            self._seam_bytes = 0
+
+        if len(data) >= self.crossfade_bytes:
+            # Large writes go straight to the sink, only their end is kept back.
+            if self._tail:
+                await self.sink(memoryview(self._tail))
+            split = len(data) - self.crossfade_bytes
+            if split:
+                await self.sink(data[:split])
+            self._tail = bytearray(data[split:])
+            return
+
+        self._tail.extend(data)
+        if len(self._tail) > self.crossfade_bytes:
+            flush = len(self._tail) - self.crossfade_bytes
+            await self.sink(memoryview(self._tail)[:flush])
+            self._tail = self._tail[flush:]
+
+    def next_segment(self) -> int:
+        """Marks a seam: the start of the following writes is mixed into the held back tail.
+
+        Returns the number of frames of the next segment that will be mixed in, 0 when the previous seam is
+        still waiting for its frames: the next segment carries on filling it.
+        """
+        if self._seam_bytes:
+            return 0
+        self._seam_bytes = min(self.crossfade_bytes, len(self._tail))
+        return self._seam_bytes // FRAME_SIZE
+
+    async def close(self):
+        if self._head:
+            # The segment after the seam was shorter than the crossfade.
+            start = len(self._tail) - self._seam_bytes
+            end = start + len(self._head)
+            self._tail[start:end] = crossfade(self._tail[start:end], self._head)
+            self._head.clear()
+        if self._tail:
+            await self.sink(memoryview(self._tail))
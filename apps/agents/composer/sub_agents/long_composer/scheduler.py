@@ -0,0 +1,82 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+
+from composer.schema.music_plan import MusicStanza
+from composer.utils.audio import SAMPLE_RATE
+
+BEATS_PER_BAR = 4
+
+
+def stanza_frames(stanza: MusicStanza, align_to_bars: bool = False, sample_rate: int = SAMPLE_RATE) -> int:
+    """Returns the number of audio frames the stanza should last.
+
+    When `align_to_bars` is set, the length is rounded to a whole number of bars at the stanza bpm,
+    so section changes land on a downbeat.
+    """
+    if not align_to_bars:
+        return stanza.seconds * sample_rate
+
+    bar_seconds = BEATS_PER_BAR * 60 / stanza.config.bpm
+    bars = max(1, round(stanza.seconds / bar_seconds))
+    return round(bars * bar_seconds * sample_rate)
+
+
+class StanzaScheduler:
+    """Counts received audio frames and releases the stanza loop when a stanza boundary is reached.
+
+    Stanza boundaries follow the audio that actually arrived rather than wall-clock time, so network
+    jitter or slow receives don't move section changes or change the length of the song.
+    """
+
+    def __init__(self, stanzas: list[MusicStanza], align_to_bars: bool = False, sample_rate: int = SAMPLE_RATE,
+                 lead_in_frames: int = 0):
+        self.boundaries = list(itertools.accumulate(
+            (stanza_frames(s, align_to_bars, sample_rate) for s in stanzas), initial=lead_in_frames))[1:]
+        self.received_frames = 0
+        self._waiters: list[tuple[int, int, asyncio.Event]] = []
+        self._closed = False
+
+    @property
+    def total_frames(self) -> int:
+        return self.boundaries[-1] if self.boundaries else 0
+
+    @property
+    def remaining_frames(self) -> int:
+        return max(0, self.total_frames - self.received_frames)
+
+    def stanza_start(self, index: int) -> int:
+        """Returns the frame at which the stanza at `index` begins."""
+        return self.boundaries[index - 1] if index else 0
+
+    def stanza_at(self, frame: int) -> int:
+        """Returns the index of the stanza playing at `frame`."""
+        return min(bisect.bisect_right(self.boundaries, frame), len(self.boundaries) - 1)
+
+    def rewind(self, frames: int):
+        """Un-counts frames, e.g. received audio that is mixed over a resume crossfade."""
+        self.received_frames -= frames
+
+    def advance(self, frames: int):
+        self.received_frames += frames
+        while self._waiters and self._waiters[0][0] <= self.received_frames:
+            heapq.heappop(self._waiters)[2].set()
+
+    def close(self):
+        """Releases every waiter, e.g. when the audio stream ended before all frames arrived."""
+        self._closed = True
+        while self._waiters:
+            heapq.heappop(self._waiters)[2].set()
+
+    async def wait_until(self, frame: int):
+        """Waits until `frame` frames have been received."""
+        if self._closed or self.received_frames >= frame:
+            return
+        event = asyncio.Event()
+        heapq.heappush(self._waiters, (frame, id(event), event))
+        await event.wait()
+
+    async def wait_for_stanza(self, index: int):
+        """Waits until all frames of the stanza at `index` have been received."""
+        await self.wait_until(self.boundaries[index])
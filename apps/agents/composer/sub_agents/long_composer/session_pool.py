@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import logging
+import os
+import time
+from typing import AsyncIterator
+
+from google import genai
+from google.genai.live_music import AsyncMusicSession
+from websockets.protocol import State
+
+MODEL = 'models/lyria-realtime-exp'
+POOL_SIZE = int(os.environ.get('LYRIA_POOL_SIZE', 2))
+IDLE_SECONDS = float(os.environ.get('LYRIA_POOL_IDLE_SECONDS', 60))
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def get_client() -> genai.Client:
+    """Returns the process-wide Gemini API client used for Lyria RealTime."""
+    return genai.Client(vertexai=False, api_key=os.environ.get('GEMINI_API_KEY'), http_options={'api_version': 'v1alpha'})
+
+
+@dataclasses.dataclass
+class _Connection:
+    session: AsyncMusicSession
+    stack: contextlib.AsyncExitStack
+    loop: asyncio.AbstractEventLoop
+    opened_at: float
+    expiry: asyncio.TimerHandle | None = None
+
+
+class MusicSessionPool:
+    """Small pool of pre-connected Lyria RealTime sessions.
+
+    `prewarm` opens connections in the background, e.g. while the plan is still being written, so that
+    the websocket handshake is off the critical path of a render. A session carries musical context once
+    it has played, so sessions are single-use: they are closed after use instead of being returned.
+    Idle connections are closed `idle_seconds` after they were opened, and health checked when acquired.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, idle_seconds: float = IDLE_SECONDS, model: str = MODEL):
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.model = model
+        self._idle: list[_Connection] = []
+        self._opening: set[asyncio.Task] = set()
+        self._closing: set[asyncio.Task] = set()
+
+    async def _open(self) -> _Connection:
+        stack = contextlib.AsyncExitStack()
+        session = await stack.enter_async_context(get_client().aio.live.music.connect(model=self.model))
+        return _Connection(session, stack, asyncio.get_running_loop(), time.monotonic())
+
+    async def _open_idle(self):
+        try:
+            connection = await self._open()
+        except Exception as e:
+            logger.warning(f"failed to prewarm a music session: {e}")
+            return
+        connection.expiry = connection.loop.call_later(self.idle_seconds, self._expire, connection)
+        self._idle.append(connection)
+
+    def _expire(self, connection: _Connection):
+        """Closes a connection that stayed idle, e.g. prewarmed for a plan that was never rendered."""
+        if connection in self._idle:
+            self._idle.remove(connection)
+            self._close_later(connection)
+
+    def _close_later(self, connection: _Connection):
+        task = asyncio.create_task(self._discard(connection))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _healthy(self, connection: _Connection) -> bool:
+        if connection.loop is not asyncio.get_running_loop():
+            return False
+        if time.monotonic() - connection.opened_at > self.idle_seconds:
+            return False
+        ws = getattr(connection.session, "_ws", None)
+        return getattr(ws, "state", State.OPEN) is State.OPEN
+
+    async def _discard(self, connection: _Connection):
+        if connection.expiry is not None:
+            connection.expiry.cancel()
+        if connection.loop is not asyncio.get_running_loop():
+            # The loop that owned it is gone, there is nothing left to close from here.
+            return
+        try:
+            await connection.stack.aclose()
+        except Exception as e:
+            logger.info(f"failed to close an idle music session: {e}")
+
+    def prewarm(self, count: int = 1):
+        """Evicts stale idle connections and starts opening new ones in the background, up to the pool size."""
+        for connection in [c for c in self._idle if not self._healthy(c)]:
+            self._idle.remove(connection)
+            self._close_later(connection)
+        count = min(count, self.size - len(self._idle) - len(self._opening))
+        for _ in range(count):
+            task = asyncio.create_task(self._open_idle())
+            self._opening.add(task)
+            task.add_done_callback(self._opening.discard)
+
+    async def _acquire(self) -> _Connection:
+        while True:
+            while self._idle:
+                connection = self._idle.pop()
+                if self._healthy(connection):
+                    connection.expiry.cancel()
+                    return connection
+                await self._discard(connection)
+            if not self._opening:
+                return await self._open()
+            await asyncio.wait(set(self._opening), return_when=asyncio.FIRST_COMPLETED)
+
+    @contextlib.asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncMusicSession]:
+        """Yields a connected session, taken from the pool when one is warm, and closes it afterwards."""
+        connection = await self._acquire()
+        logger.info(f"acquired music session opened {time.monotonic() - connection.opened_at:.1f}s ago")
+        try:
+            yield connection.session
+        finally:
+            await connection.stack.aclose()
+
+
+music_sessions = MusicSessionPool()
@@ -0,0 +1,68 @@
+import logging
+
+from google.genai import types
+from google.genai.live_music import AsyncMusicSession
+
+from composer.schema.music_plan import MusicStanza
+from composer.utils.audio import SAMPLE_RATE
+from .scheduler import StanzaScheduler
+
+TRANSITION_SECONDS = 8.0
+CONTROL_RATE = 4.0
+# Lyria RealTime rejects a weight of 0, so prompts fading below this are left out.
+MIN_WEIGHT = 0.01
+
+logger = logging.getLogger(__name__)
+
+
+def interpolate_prompts(previous: MusicStanza, current: MusicStanza, progress: float) -> list[types.WeightedPrompt]:
+    """Blends the prompts of two stanzas, `progress` going from 0 (previous) to 1 (current)."""
+    weights: dict[str, float] = {}
+    for prompt in previous.prompts:
+        weights[prompt.text] = weights.get(prompt.text, 0.0) + (1 - progress) * (prompt.weight or 1.0)
+    for prompt in current.prompts:
+        weights[prompt.text] = weights.get(prompt.text, 0.0) + progress * (prompt.weight or 1.0)
+    return [types.WeightedPrompt(text=text, weight=weight) for text, weight in weights.items() if weight >= MIN_WEIGHT]
+
+
+class PromptTransition:
+    """Cross-fades the weighted prompts of consecutive stanzas.
+
+    Instead of switching prompts at a stanza boundary, interpolated weights are sent to the session at
+    `control_rate` updates per second over `seconds` of received audio, so the plan only has to contain
+    the musical sections themselves.
+    """
+
+    def __init__(self, seconds: float = TRANSITION_SECONDS, control_rate: float = CONTROL_RATE,
+                 sample_rate: int = SAMPLE_RATE):
+        self.frames = int(seconds * sample_rate)
+        self.step_frames = max(1, int(sample_rate / control_rate))
+
+    def _steps(self, scheduler: StanzaScheduler, index: int) -> tuple[int, int]:
+        start = scheduler.stanza_start(index)
+        frames = min(self.frames, scheduler.boundaries[index] - start)
+        return start, max(1, frames // self.step_frames)
+
+    def _current_step(self, scheduler: StanzaScheduler, start: int, steps: int) -> int:
+        return min(steps, max(0, scheduler.received_frames - start) // self.step_frames + 1)
+
+    def prompts_at(self, scheduler: StanzaScheduler, index: int, previous: MusicStanza,
+                   current: MusicStanza) -> tuple[int, list[types.WeightedPrompt]]:
+        """Returns the step for the frames received so far and its blended prompts, e.g. to resume
+        mid-transition."""
+        start, steps = self._steps(scheduler, index)
+        step = self._current_step(scheduler, start, steps)
+        return step, interpolate_prompts(previous, current, step / steps)
+
+    async def run(self, session: AsyncMusicSession, scheduler: StanzaScheduler, index: int,
+                  previous: MusicStanza, current: MusicStanza, sent_step: int = 0):
+        """Ramps from `previous` to `current`, starting at the first frame of the stanza at `index`.
+
+        Steps whose frames were already received are skipped, as are those up to `sent_step` when the
+        prompts of that step were already sent from `prompts_at`.
+        """
+        start, steps = self._steps(scheduler, index)
+        logger.info(f"transition to stanza {index} in {steps} steps")
+        for step in range(max(sent_step + 1, self._current_step(scheduler, start, steps)), steps + 1):
+            await scheduler.wait_until(start + (step - 1) * self.step_frames)
+            await session.set_weighted_prompts(prompts=interpolate_prompts(previous, current, step / steps))
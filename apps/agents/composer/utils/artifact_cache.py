@@ -0,0 +1,106 @@
+import collections
+import logging
+import os
+from typing import Optional
+
+from google.adk.artifacts import BaseArtifactService
+from google.genai import types
+
+CACHE_BYTES = int(os.environ.get('ARTIFACT_CACHE_MB', 256)) * 2**20
+
+logger = logging.getLogger(__name__)
+
+CacheKey = tuple[str, str, str, str, int]
+
+
+def part_size(part: types.Part) -> int:
+    if part.inline_data and part.inline_data.data:
+        return len(part.inline_data.data)
+    return len(part.text or "")
+
+
+def artifact_name(app_name: str, user_id: str, session_id: str, filename: str) -> tuple[str, str, str, str]:
+    """Identifies an artifact in the cache, without the session for the `user:` filenames a user's sessions share."""
+    return app_name, user_id, "" if filename.startswith("user:") else session_id, filename
+
+
+class CachingArtifactService(BaseArtifactService):
+    """Read-through, write-through in-memory cache in front of any artifact service.
+
+    Artifacts are cached per `(app_name, user_id, session_id, filename, version)` up to `max_bytes` of
+    content, evicting the least recently used. `user:` filenames are shared by all the sessions of a user,
+    so they are cached without the session. Saved artifacts are cached right away, so replaying a song
+    that was just generated doesn't go back to storage. Loading the latest version always asks the wrapped
+    service which version is latest, which doesn't transfer the artifact, so a version saved by another
+    instance is never masked by the cache.
+    """
+
+    def __init__(self, service: BaseArtifactService, max_bytes: int = CACHE_BYTES):
+        self.service = service
+        self.max_bytes = max_bytes
+        self.counters = collections.Counter(hits=0, misses=0, evictions=0)
+        self._cache: collections.OrderedDict[CacheKey, types.Part] = collections.OrderedDict()
+        self._size = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return self.counters["hits"] / lookups if lookups else 0.0
+
+    def _put(self, key: CacheKey, part: types.Part) -> bool:
+        """Caches `part`, unless it alone exceeds `max_bytes`, and returns whether it did."""
+        size = part_size(part)
+        if size > self.max_bytes:
+            return False
+        if key in self._cache:
+            self._size -= part_size(self._cache.pop(key))
+        self._cache[key] = part
+        self._size += size
+        while self._size > self.max_bytes:
+            evicted_key, evicted = self._cache.popitem(last=False)
+            self._size -= part_size(evicted)
+            self.counters["evictions"] += 1
+        return True
+
+    async def save_artifact(self, *, app_name: str, user_id: str, session_id: str, filename: str,
+                            artifact: types.Part) -> int:
+        version = await self.service.save_artifact(app_name=app_name, user_id=user_id, session_id=session_id,
+                                                   filename=filename, artifact=artifact)
+        self._put((*artifact_name(app_name, user_id, session_id, filename), version), artifact)
+        return version
+
+    async def load_artifact(self, *, app_name: str, user_id: str, session_id: str, filename: str,
+                            version: Optional[int] = None) -> Optional[types.Part]:
+        if version is None:
+            versions = await self.service.list_versions(app_name=app_name, user_id=user_id, session_id=session_id,
+                                                        filename=filename)
+            if not versions:
+                return None
+            version = max(versions)
+
+        key = (*artifact_name(app_name, user_id, session_id, filename), version)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.counters["hits"] += 1
+            return self._cache[key]
+
+        self.counters["misses"] += 1
+        artifact = await self.service.load_artifact(app_name=app_name, user_id=user_id, session_id=session_id,
+                                                    filename=filename, version=version)
+        if artifact is not None:
+            self._put(key, artifact)
+        logger.info(f"artifact cache {dict(self.counters)} hit rate {self.hit_rate:.2f}")
+        return artifact
+
+    async def list_artifact_keys(self, *, app_name: str, user_id: str, session_id: str) -> list[str]:
+        return await self.service.list_artifact_keys(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    async def delete_artifact(self, *, app_name: str, user_id: str, session_id: str, filename: str) -> None:
+        await self.service.delete_artifact(app_name=app_name, user_id=user_id, session_id=session_id, filename=filename)
+        name = artifact_name(app_name, user_id, session_id, filename)
+        for key in [k for k in self._cache if k[:4] == name]:
+            self._size -= part_size(self._cache.pop(key))
+
+    async def list_versions(self, *, app_name: str, user_id: str, session_id: str, filename: str) -> list[int]:
+        return await self.service.list_versions(app_name=app_name, user_id=user_id, session_id=session_id,
+                                                filename=filename)
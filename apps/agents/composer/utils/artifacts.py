@@ -0,0 +1,54 @@
+import datetime
+import hashlib
+import os
+from typing import Any, MutableMapping
+
+from google.genai import types
+
+from composer.utils.audio import mp3_duration
+
+# Session state key of the metadata of every song saved in the session, by artifact id.
+ARTIFACT_INDEX_KEY = "artifact_index"
+# Session state key of the artifact the long composer saves its previews to when it runs as a tool.
+PREVIEW_ARTIFACT_KEY = "preview_artifact_id"
+
+
+def use_artifact_references() -> bool:
+    """Whether audio is sent as references that the client loads itself rather than as inline bytes.
+
+    ARTIFACT_DELIVERY selects `reference` or `inline`. Without it, references are used on Agent Engine.
+    """
+    delivery = os.environ.get("ARTIFACT_DELIVERY")
+    if delivery:
+        return delivery == "reference"
+    return "GOOGLE_CLOUD_AGENT_ENGINE_ID" in os.environ
+
+
+def artifact_reference(filename: str, tag: str = "artifact") -> types.Part:
+    """Returns a text part such as `<artifact>filename</artifact>` standing in for the audio."""
+    return types.Part.from_text(text=f"<{tag}>{filename}</{tag}>")
+
+
+def preview_artifact_id(function_call_id: str) -> str:
+    """Names the preview artifact of a tool call, so a client can poll it while the call is running."""
+    return f"preview-{function_call_id}"
+
+
+def artifact_metadata(part: types.Part) -> dict[str, Any]:
+    """Describes an audio artifact, so listing songs doesn't require loading their bytes."""
+    data, mime_type = part.inline_data.data, part.inline_data.mime_type
+    return {
+        "size": len(data),
+        "mime_type": mime_type,
+        "codec": mime_type.partition("/")[2],
+        "duration_seconds": mp3_duration(data) if mime_type in ("audio/mp3", "audio/mpeg") else None,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def index_artifact(state: MutableMapping[str, Any], artifact_id: str, part: types.Part) -> dict[str, Any]:
+    """Adds the metadata of an artifact to the index in `state` and returns the updated index."""
+    index = {**(state.get(ARTIFACT_INDEX_KEY) or {}), artifact_id: artifact_metadata(part)}
+    state[ARTIFACT_INDEX_KEY] = index
+    return index
@@ -1,10 +1,302 @@
-import io
+import asyncio
+import collections
+import dataclasses
+import logging
 import os
+import signal
+from typing import AsyncIterable, AsyncIterator, Iterable
 
 from pydub import AudioSegment
 
-def convert_mp3(audio_segment: AudioSegment) -> bytes:
-    out = io.BytesIO()
-    audio_segment.export(out, format="mp3")
-    return out.getvalue()
+SAMPLE_RATE = 48000
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+FRAME_SIZE = CHANNELS * SAMPLE_WIDTH
 
+READ_SIZE = 64 * 1024
+# Bytes of junk mp3_duration skips looking for frame headers before it gives up.
+MAX_RESYNC_BYTES = 64 * 1024
+ENCODER_POOL_SIZE = int(os.environ.get('AUDIO_ENCODER_POOL_SIZE', 2))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Codec:
+    encoder: str
+    format: str
+    mime_type: str
+    extension: str
+
+
+MP3_BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+CODECS = {
+    "mp3": Codec(encoder="libmp3lame", format="mp3", mime_type="audio/mp3", extension="mp3"),
+    "opus": Codec(encoder="libopus", format="ogg", mime_type="audio/ogg", extension="ogg"),
+    "aac": Codec(encoder="aac", format="adts", mime_type="audio/aac", extension="aac"),
+}
+
+
+def mp3_duration(data: bytes) -> float | None:
+    """Returns the duration of MPEG layer III audio, None without frames.
+
+    The frame count of a Xing/Info header is used when the first frame carries one, otherwise the frame
+    headers are walked. Junk between frames is skipped up to the next sync byte, and the walk gives up with
+    None once `MAX_RESYNC_BYTES` of it were skipped, so data that isn't MP3 is rejected quickly.
+    """
+    position = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        position = 10 + ((data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f))
+    seconds = 0.0
+    skipped = 0
+    first = True
+    while position + 4 <= len(data):
+        b1, b2 = data[position + 1], data[position + 2]
+        version, layer = (b1 >> 3) & 3, (b1 >> 1) & 3
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if (data[position] != 0xff or b1 & 0xe0 != 0xe0 or version == 1 or layer != 1
+                or bitrate_index in (0, 15) or rate_index == 3):
+            # Not a frame header, look for the next sync byte.
+            found = data.find(b"\xff", position + 1)
+            next_position = found if found >= 0 else len(data)
+            skipped += next_position - position
+            if skipped > MAX_RESYNC_BYTES:
+                return None
+            position = next_position
+            continue
+        mpeg1 = version == 3
+        bitrate = MP3_BITRATES["mpeg1" if mpeg1 else "mpeg2"][bitrate_index] * 1000
+        sample_rate = (44100, 48000, 32000)[rate_index] >> (0 if mpeg1 else 1 if version == 2 else 2)
+        samples = 1152 if mpeg1 else 576
+        if first:
+            first = False
+            frames = xing_frames(data, position, mpeg1, mono=data[position + 3] >> 6 == 3)
+            if frames:
+                return frames * samples / sample_rate
+        seconds += samples / sample_rate
+        position += samples // 8 * bitrate // sample_rate + ((b2 >> 1) & 1)
+    return seconds or None
+
+
+def xing_frames(data: bytes, position: int, mpeg1: bool, mono: bool) -> int | None:
+    """Returns the frame count of the Xing/Info header in the frame at `position`, if it has one."""
+    # The tag follows the side information, whose size depends on the version and the channel mode.
+    tag = position + 4 + ((17 if mono else 32) if mpeg1 else (9 if mono else 17))
+    if data[tag:tag + 4] not in (b"Xing", b"Info") or len(data) < tag + 12:
+        return None
+    flags = int.from_bytes(data[tag + 4:tag + 8], "big")
+    return int.from_bytes(data[tag + 8:tag + 12], "big") if flags & 1 else None
+
+
+class StreamingEncoder:
+    """Encodes raw PCM with ffmpeg while the audio is still arriving.
+
+    A single ffmpeg process is fed through stdin and its output is drained from stdout concurrently,
+    so only the compressed output is held in memory and `finish` only has to flush the last few frames.
+    With `keep_output` unset, `chunks` hands the output out as it is produced instead of keeping it.
+    """
+
+    def __init__(self, codec: str = "mp3", bitrate: str | None = None, sample_rate: int = SAMPLE_RATE,
+                 channels: int = CHANNELS, sample_width: int = SAMPLE_WIDTH, keep_output: bool = True):
+        self.codec = CODECS[codec]
+        self.bitrate = bitrate
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.keep_output = keep_output
+        self._process: asyncio.subprocess.Process | None = None
+        self._reader: asyncio.Task | None = None
+        self._output = bytearray()
+        self._produced = asyncio.Event()
+
+    async def start(self):
+        if self._process is not None:
+            return
+        bitrate = ["-b:a", self.bitrate] if self.bitrate else []
+        self._process = await asyncio.create_subprocess_exec(
+            AudioSegment.converter,
+            "-hide_banner", "-loglevel", "error",
+            "-f", f"s{self.sample_width * 8}le", "-ar", str(self.sample_rate), "-ac", str(self.channels),
+            "-i", "pipe:0",
+            "-c:a", self.codec.encoder, *bitrate,
+            "-f", self.codec.format, "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            # Kept for the error message, idle pooled encoders would otherwise log broken pipes at shutdown.
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._reader = asyncio.create_task(self._drain())
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def _drain(self):
+        try:
+            while chunk := await self._process.stdout.read(READ_SIZE):
+                self._output.extend(chunk)
+                self._produced.set()
+        finally:
+            self._produced.set()
+
+    @property
+    def encoded(self) -> bytes:
+        """Encoded bytes produced so far, playable on their own."""
+        return bytes(self._output)
+
+    async def write(self, data: bytes | memoryview):
+        if data:
+            self._process.stdin.write(data)
+            await self._process.stdin.drain()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Yields the encoded output as it is produced, until ffmpeg closes its output."""
+        position = 0
+        while True:
+            if len(self._output) > position:
+                chunk = bytes(self._output[position:])
+                if self.keep_output:
+                    position = len(self._output)
+                else:
+                    del self._output[:]
+                yield chunk
+            elif self._reader.done():
+                return
+            else:
+                self._produced.clear()
+                await self._produced.wait()
+
+    async def finish(self) -> bytes:
+        self._process.stdin.close()
+        await self._reader
+        return_code = await self._process.wait()
+        if return_code != 0:
+            error = (await self._process.stderr.read()).decode(errors="replace").strip()
+            raise RuntimeError(f"ffmpeg exited with code {return_code}: {error}")
+        return bytes(self._output)
+
+    def kill(self):
+        """Kills ffmpeg without waiting for it, for an encoder whose event loop is gone."""
+        if self._process and self._process.returncode is None:
+            try:
+                os.kill(self._process.pid, signal.SIGKILL)
+                # Reaped here, as the child watcher went with the loop.
+                os.waitpid(self._process.pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+
+    async def close(self):
+        if self._process and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        if self._reader and not self._reader.done():
+            self._reader.cancel()
+
+    async def __aenter__(self) -> "StreamingEncoder":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class EncoderPool:
+    """Keeps started ffmpeg encoders ready per output format.
+
+    An ffmpeg process encodes a single stream, so encoders are single-use: `acquire` hands out a
+    started one and starts its replacement in the background, which moves the process spawn off the
+    critical path of every encode after the first of a format.
+    """
+
+    def __init__(self, size: int = ENCODER_POOL_SIZE):
+        self.size = size
+        self._idle: dict[tuple, collections.deque[StreamingEncoder]] = collections.defaultdict(collections.deque)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._starting: dict[tuple, set[asyncio.Task]] = collections.defaultdict(set)
+
+    async def _start_idle(self, key: tuple):
+        encoder = StreamingEncoder(*key)
+        try:
+            await encoder.start()
+        except Exception as e:
+            logger.warning(f"failed to start an idle encoder: {e}")
+            return
+        if self._loop is asyncio.get_running_loop():
+            self._idle[key].append(encoder)
+        else:
+            await encoder.close()
+
+    def _refill(self, key: tuple):
+        starting = self._starting[key]
+        if len(self._idle[key]) + len(starting) >= self.size:
+            return
+        task = asyncio.create_task(self._start_idle(key))
+        starting.add(task)
+        task.add_done_callback(starting.discard)
+
+    async def acquire(self, codec: str = "mp3", bitrate: str | None = None, sample_rate: int = SAMPLE_RATE,
+                      channels: int = CHANNELS, sample_width: int = SAMPLE_WIDTH, keep_output: bool = True) -> StreamingEncoder:
+        """Returns a started encoder for the given format, warm from the pool when one is ready."""
+        if self._loop is not asyncio.get_running_loop():
+            # Subprocess pipes belong to the loop that started them, so the encoders of the previous loop can
+            # neither be used nor closed from here, only killed.
+            for idle in self._idle.values():
+                for encoder in idle:
+                    encoder.kill()
+            self._idle.clear()
+            self._starting.clear()
+            self._loop = asyncio.get_running_loop()
+        key = (codec, bitrate, sample_rate, channels, sample_width)
+        idle = self._idle[key]
+        encoder = None
+        while idle and encoder is None:
+            candidate = idle.popleft()
+            if candidate.alive:
+                encoder = candidate
+        if encoder is None:
+            encoder = StreamingEncoder(*key)
+            await encoder.start()
+        encoder.keep_output = keep_output
+        self._refill(key)
+        return encoder
+
+
+encoders = EncoderPool()
+
+
+async def encode(chunks: Iterable[bytes] | AsyncIterable[bytes], codec: str = "mp3", bitrate: str | None = None,
+                 sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                 sample_width: int = SAMPLE_WIDTH) -> AsyncIterator[bytes]:
+    """Encodes PCM chunks on a pooled ffmpeg process, yielding the encoded bytes as they are produced."""
+    encoder = await encoders.acquire(codec, bitrate, sample_rate, channels, sample_width, keep_output=False)
+    async with encoder:
+        async def feed():
+            if isinstance(chunks, AsyncIterable):
+                async for chunk in chunks:
+                    await encoder.write(chunk)
+            else:
+                for chunk in chunks:
+                    await encoder.write(chunk)
+            await encoder.finish()
+
+        feeder = asyncio.create_task(feed())
+        try:
+            async for data in encoder.chunks():
+                yield data
+            await feeder
+        finally:
+            feeder.cancel()
+
+
+async def encode_bytes(pcm: bytes | memoryview, codec: str = "mp3", bitrate: str | None = None,
+                       sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS, sample_width: int = SAMPLE_WIDTH) -> bytes:
+    return b"".join([data async for data in encode([pcm], codec, bitrate, sample_rate, channels, sample_width)])
+
+
+async def convert_mp3(audio_segment: AudioSegment) -> bytes:
+    return await encode_bytes(audio_segment.raw_data, "mp3", sample_rate=audio_segment.frame_rate,
+                              channels=audio_segment.channels, sample_width=audio_segment.sample_width)
@@ -0,0 +1,129 @@
+import asyncio
+import contextlib
+import mmap
+import os
+import tempfile
+from typing import AsyncIterator, Iterator
+
+import numpy as np
+
+from composer.utils.audio import CHANNELS, FRAME_SIZE, SAMPLE_RATE
+
+SLAB_SECONDS = 0.5
+SLABS = 8
+SPILL_THRESHOLD = int(os.environ.get('PCM_SPILL_THRESHOLD_MB', 32)) * 2**20
+
+
+def crossfade(tail: bytes | bytearray, head: bytes | bytearray) -> bytes:
+    """Mixes two PCM windows of the same length with an equal-power fade from `tail` to `head`."""
+    fade_out = np.frombuffer(tail, dtype=np.int16).reshape(-1, CHANNELS)
+    fade_in = np.frombuffer(head, dtype=np.int16).reshape(-1, CHANNELS)
+    curve = np.linspace(0, np.pi / 2, len(fade_out), dtype=np.float32)[:, np.newaxis]
+    mixed = fade_out * np.cos(curve) + fade_in * np.sin(curve)
+    return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+
+class PcmRing:
+    """Fixed pool of preallocated PCM slabs between the receive task and its consumer.
+
+    Incoming chunks are copied once into the current slab through a memoryview. Full slabs are handed
+    to the consumer and recycled after it has processed them, so the receive path doesn't allocate per
+    chunk and memory stays bounded by `slabs * slab_seconds` of audio whatever the song length.
+    """
+
+    def __init__(self, slab_seconds: float = SLAB_SECONDS, slabs: int = SLABS, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._slabs = [bytearray(int(slab_seconds * sample_rate) * FRAME_SIZE) for _ in range(slabs)]
+        self._free: asyncio.Queue[int] = asyncio.Queue()
+        self._filled: asyncio.Queue[tuple[int, int] | None] = asyncio.Queue()
+        for index in range(slabs):
+            self._free.put_nowait(index)
+        self._current: int | None = None
+        self._offset = 0
+
+    async def write(self, data: bytes | memoryview):
+        view = memoryview(data)
+        while view:
+            if self._current is None:
+                self._current = await self._free.get()
+                self._offset = 0
+            slab = self._slabs[self._current]
+            size = min(len(view), len(slab) - self._offset)
+            slab[self._offset:self._offset + size] = view[:size]
+            self._offset += size
+            view = view[size:]
+            if self._offset == len(slab):
+                self._submit()
+
+    def _submit(self):
+        if self._current is not None and self._offset:
+            self._filled.put_nowait((self._current, self._offset))
+        elif self._current is not None:
+            self._free.put_nowait(self._current)
+        self._current = None
+
+    def close(self):
+        """Hands over the partially filled slab and ends the stream."""
+        self._submit()
+        self._filled.put_nowait(None)
+
+    async def chunks(self) -> AsyncIterator[memoryview]:
+        """Yields buffered PCM in order. Each view is only valid until the next chunk is requested."""
+        while (item := await self._filled.get()) is not None:
+            index, size = item
+            try:
+                yield memoryview(self._slabs[index])[:size]
+            finally:
+                self._free.put_nowait(index)
+
+
+class SpillingPcmBuffer:
+    """Append-only PCM buffer that keeps up to `threshold` bytes in memory and spills to a temp file.
+
+    Once spilled, the audio is read back through a read-only memory map, so long renders are paged in
+    from disk while they are encoded instead of living on the heap.
+    """
+
+    def __init__(self, threshold: int = SPILL_THRESHOLD, directory: str | None = None):
+        self.threshold = threshold
+        self.directory = directory
+        self._memory = bytearray()
+        self._file = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    async def write(self, data: bytes | memoryview):
+        if self._file is None and self._size + len(data) > self.threshold:
+            self._file = tempfile.TemporaryFile(dir=self.directory)
+            self._file.write(self._memory)
+            self._memory = bytearray()
+        if self._file is None:
+            self._memory.extend(data)
+        else:
+            self._file.write(data)
+        self._size += len(data)
+
+    @contextlib.contextmanager
+    def view(self) -> Iterator[memoryview]:
+        """Yields the buffered PCM without copying it. The view must not be used after the block."""
+        if self._file is None:
+            with memoryview(self._memory) as view:
+                yield view
+            return
+
+        self._file.flush()
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            yield view
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = bytearray()
+        self._size = 0
@@ -0,0 +1,191 @@
+import dataclasses
+from typing import Literal
+
+import numpy as np
+from pydub import AudioSegment
+
+from composer.utils.audio import CHANNELS, SAMPLE_RATE
+
+INT16_SCALE = 32768.0
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20)
+
+
+@dataclasses.dataclass(frozen=True)
+class PostProcessing:
+    """Settings of the post-processing applied to rendered PCM before it is encoded."""
+
+    silence_db: float = -50.0
+    """Frames whose loudest channel stays below this level count as silence and are trimmed at both ends."""
+    fade_in_seconds: float = 0.05
+    fade_out_seconds: float = 2.0
+    normalize: Literal["peak", "loudness"] | None = "loudness"
+    """`peak` scales the loudest sample to `target_db`, `loudness` scales the gated RMS level to `target_db`.
+
+    The gain is measured on the whole piece, so it only applies to a calibrated `PostProcessor`.
+    """
+    target_db: float = -16.0
+    max_gain_db: float = 12.0
+    """Upper bound of the normalization gain, so quiet renders aren't pumped up into noise."""
+    ceiling_db: float = -1.0
+    """Peak level the limiter keeps the output under."""
+    limiter_block_seconds: float = 0.005
+
+
+def to_frames(pcm: bytes | memoryview, channels: int = CHANNELS) -> np.ndarray:
+    """Returns 16-bit PCM as a float32 array of shape (frames, channels) in [-1, 1)."""
+    return np.frombuffer(pcm, dtype=np.int16).reshape(-1, channels).astype(np.float32) / INT16_SCALE
+
+
+def to_pcm(frames: np.ndarray) -> bytes:
+    return np.clip(frames * INT16_SCALE, -INT16_SCALE, INT16_SCALE - 1).astype(np.int16).tobytes()
+
+
+def frame_peaks(frames: np.ndarray) -> np.ndarray:
+    """Returns the absolute peak of each frame across channels."""
+    # Reducing over the short channel axis is much slower than an elementwise maximum per channel.
+    peaks = np.abs(frames[:, 0])
+    for channel in range(1, frames.shape[1]):
+        np.maximum(peaks, np.abs(frames[:, channel]), out=peaks)
+    return peaks
+
+
+def limit(frames: np.ndarray, ceiling: float, block: int, start_gain: float = 1.0,
+          end_gain: float | None = None) -> float:
+    """Keeps the peaks of `frames` under `ceiling` in place and returns the gain of the last block.
+
+    The gain needed by each block of `block` frames is interpolated linearly between block boundaries,
+    taking the lower gain of the two blocks at each boundary, so no sample ends up above the ceiling and
+    the gain never jumps. `start_gain` and `end_gain` are the gains of the blocks around `frames` when it
+    is a part of a longer stream.
+    """
+    if not len(frames):
+        return start_gain
+    peaks = np.maximum.reduceat(frame_peaks(frames), np.arange(0, len(frames), block))
+    gains = np.minimum(1.0, ceiling / np.maximum(peaks, 1e-9))
+    boundaries = np.empty(len(gains) + 1, dtype=np.float32)
+    boundaries[0] = min(start_gain, gains[0])
+    boundaries[1:-1] = np.minimum(gains[:-1], gains[1:])
+    boundaries[-1] = gains[-1] if end_gain is None else min(gains[-1], end_gain)
+    if boundaries.min() < 1.0:
+        positions = np.minimum(np.arange(len(boundaries)) * block, len(frames))
+        frames *= np.interp(np.arange(len(frames)), positions, boundaries).astype(np.float32)[:, None]
+    return float(gains[-1])
+
+
+class PostProcessor:
+    """Trims silence, fades, normalizes and limits 16-bit PCM, in one go or while it streams in.
+
+    Leading silence is dropped as it arrives. The end of the stream is held back until `flush`, for as
+    long as it is silent and at least for the fade-out, so trailing silence can be cut and faded.
+
+    The normalization gain is fixed from the whole piece by `calibrate`. A gain following the level
+    measured so far would act as an automatic gain control, pumping up a quiet intro and then pushing the
+    loud section into the limiter, so a stream that can't be calibrated is only limited.
+    """
+
+    def __init__(self, settings: PostProcessing = PostProcessing(), sample_rate: int = SAMPLE_RATE,
+                 channels: int = CHANNELS):
+        self.settings = settings
+        self.channels = channels
+        self.threshold = db_to_gain(settings.silence_db)
+        self.ceiling = db_to_gain(settings.ceiling_db)
+        self.fade_in_frames = int(settings.fade_in_seconds * sample_rate)
+        self.fade_out_frames = int(settings.fade_out_seconds * sample_rate)
+        self.block = max(1, int(settings.limiter_block_seconds * sample_rate))
+        self._pending = np.zeros((0, channels), dtype=np.float32)
+        self._last_loud = -1
+        self._started = False
+        self._output_frames = 0
+        self._limit_gain = 1.0
+        self._gain = 1.0
+        self._peak = 0.0
+        self._square_sum = 0.0
+        self._loud_count = 0
+
+    def calibrate(self, pcm: bytes | memoryview):
+        """Fixes the normalization gain from the level of the complete `pcm`."""
+        frames = to_frames(pcm, self.channels)
+        peaks = frame_peaks(frames)
+        if len(peaks):
+            self._peak = max(self._peak, float(peaks.max()))
+        loud = frames[peaks >= self.threshold]
+        self._square_sum += float(np.einsum("ij,ij->", loud, loud, dtype=np.float64)) / self.channels
+        self._loud_count += len(loud)
+        self._gain = self._target_gain()
+
+    def _target_gain(self) -> float:
+        if self.settings.normalize == "peak":
+            level = self._peak
+        elif self.settings.normalize == "loudness":
+            level = np.sqrt(self._square_sum / self._loud_count) if self._loud_count else 0.0
+        else:
+            return 1.0
+        if not level:
+            return self._gain
+        return min(db_to_gain(self.settings.max_gain_db), db_to_gain(self.settings.target_db) / level)
+
+    def _release(self, count: int, end_gain: float | None) -> np.ndarray:
+        frames, self._pending = self._pending[:count], self._pending[count:]
+        self._last_loud -= count
+        self._limit_gain = limit(frames, self.ceiling, self.block, self._limit_gain, end_gain)
+        fade_in = min(count, self.fade_in_frames - self._output_frames)
+        if fade_in > 0:
+            ramp = np.arange(self._output_frames, self._output_frames + fade_in, dtype=np.float32) / self.fade_in_frames
+            frames[:fade_in] *= ramp[:, None]
+        self._output_frames += count
+        return frames
+
+    def process(self, pcm: bytes | memoryview) -> bytes:
+        """Returns the processed PCM that can be released, which may be empty."""
+        frames = to_frames(pcm, self.channels)
+        peaks = frame_peaks(frames)
+        loud = np.flatnonzero(peaks >= self.threshold)
+        if not self._started:
+            if not len(loud):
+                return b""
+            frames, peaks, loud = frames[loud[0]:], peaks[loud[0]:], loud - loud[0]
+            self._started = True
+        if self._gain != 1.0:
+            frames *= self._gain
+
+        if len(loud):
+            self._last_loud = len(self._pending) + int(loud[-1])
+        self._pending = np.concatenate((self._pending, frames))
+        # Keep the fade-out and one limiter block of look-ahead, and everything after the last loud frame.
+        count = min(self._last_loud + 1 - self.fade_out_frames, len(self._pending) - self.block)
+        count -= count % self.block
+        if count <= 0:
+            return b""
+        end_gain = limit(self._pending[count:count + self.block].copy(), self.ceiling, self.block)
+        return to_pcm(self._release(count, end_gain))
+
+    def flush(self) -> bytes:
+        """Returns the rest of the stream, with trailing silence trimmed and faded out."""
+        if not self._started:
+            return b""
+        self._pending = self._pending[:self._last_loud + 1]
+        count = len(self._pending)
+        fade_out = min(count, self.fade_out_frames)
+        frames = self._release(count, None)
+        if fade_out:
+            frames[count - fade_out:] *= np.linspace(1.0, 0.0, fade_out, dtype=np.float32)[:, None]
+        return to_pcm(frames)
+
+
+def postprocess(pcm: bytes | memoryview, settings: PostProcessing = PostProcessing(), sample_rate: int = SAMPLE_RATE,
+                channels: int = CHANNELS) -> bytes:
+    """Post-processes a complete piece of 16-bit PCM."""
+    processor = PostProcessor(settings, sample_rate, channels)
+    processor.calibrate(pcm)
+    return processor.process(pcm) + processor.flush()
+
+
+def postprocess_segment(audio_segment: AudioSegment, settings: PostProcessing = PostProcessing()) -> AudioSegment:
+    """Post-processes a decoded 16-bit segment, other sample widths are returned unchanged."""
+    if audio_segment.sample_width != 2:
+        return audio_segment
+    pcm = postprocess(audio_segment.raw_data, settings, audio_segment.frame_rate, audio_segment.channels)
+    return AudioSegment(data=pcm, sample_width=2, frame_rate=audio_segment.frame_rate, channels=audio_segment.channels)
@@ -17,8 +17,9 @@ SETTING_FILENAME = ".agentengine.json"
 
 bucket = os.environ.get('ARTIFACT_BUCKET')
 def generate_artifact_service():
-    # TODO
-    return GcsArtifactService(bucket)
+    from composer.utils.artifact_cache import CachingArtifactService
+
+    return CachingArtifactService(GcsArtifactService(bucket))
 
 def deploy_agentengine():
     from composer.agent import root_agent
@@ -38,6 +39,7 @@ def deploy_agentengine():
     requirements = [
         "google-adk==1.14.1",
         "pydub>=0.25.1",
+        "numpy>=1.26",
         "google-cloud-aiplatform[adk, agent_engines]==1.115.0"
     ]
     display_name = "ComposerAgent"
@@ -0,0 +1,81 @@
+import base64
+import types
+import unittest
+
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.sessions import InMemorySessionService
+from google.genai import types as genai_types
+
+from composer.agentengine import CustomAdkApp
+from composer.utils.artifacts import ARTIFACT_INDEX_KEY
+
+APP_NAME = "composer"
+USER_ID = "user"
+SESSION_ID = "session"
+DATA = bytes(range(256)) * 4
+
+
+class StreamArtifactTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        artifact_service = InMemoryArtifactService()
+        await artifact_service.save_artifact(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID,
+                                             filename="song.mp3",
+                                             artifact=genai_types.Part.from_bytes(data=DATA, mime_type="audio/mpeg"))
+        self.app = types.SimpleNamespace(_tmpl_attrs={"app_name": APP_NAME, "artifact_service": artifact_service})
+
+    async def stream(self, artifact_id="song.mp3", **kwargs) -> list[dict]:
+        return [item async for item in CustomAdkApp.stream_artifact(self.app, USER_ID, SESSION_ID, artifact_id,
+                                                                     **kwargs)]
+
+    def join(self, items: list[dict]) -> bytes:
+        return b"".join(base64.b64decode(item["data"]) for item in items[1:])
+
+    async def test_whole_artifact(self):
+        items = await self.stream(chunk_size=100)
+        self.assertEqual(items[0], {"mime_type": "audio/mpeg", "size": len(DATA), "offset": 0, "length": len(DATA)})
+        self.assertEqual([item["offset"] for item in items[1:]], list(range(0, len(DATA), 100)))
+        self.assertEqual(self.join(items), DATA)
+
+    async def test_range(self):
+        items = await self.stream(offset=10, length=250, chunk_size=100)
+        self.assertEqual(items[0]["length"], 250)
+        self.assertEqual(self.join(items), DATA[10:260])
+
+    async def test_range_clamped_to_size(self):
+        items = await self.stream(offset=1000, length=100)
+        self.assertEqual(items[0]["length"], len(DATA) - 1000)
+        self.assertEqual(self.join(items), DATA[1000:])
+
+    async def test_offset_past_end(self):
+        items = await self.stream(offset=len(DATA) + 10)
+        self.assertEqual(items, [{"mime_type": "audio/mpeg", "size": len(DATA), "offset": len(DATA) + 10,
+                                  "length": 0}])
+
+    async def test_missing_artifact(self):
+        self.assertEqual(await self.stream("missing.mp3"), [])
+
+    async def test_invalid_range(self):
+        for kwargs in ({"offset": -1}, {"length": -1}, {"offset": 5, "length": -5}, {"chunk_size": 0}):
+            with self.subTest(**kwargs), self.assertRaises(ValueError):
+                await self.stream(**kwargs)
+
+
+class ListArtifactMetadataTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        session_service = InMemorySessionService()
+        await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID,
+                                             state={ARTIFACT_INDEX_KEY: {"song.mp3": {"duration": 30.0}}})
+        self.app = types.SimpleNamespace(_tmpl_attrs={"app_name": APP_NAME, "session_service": session_service})
+
+    async def test_index(self):
+        self.assertEqual(await CustomAdkApp.list_artifact_metadata(self.app, USER_ID, SESSION_ID),
+                         {"song.mp3": {"duration": 30.0}})
+
+    async def test_unknown_session(self):
+        self.assertEqual(await CustomAdkApp.list_artifact_metadata(self.app, USER_ID, "missing"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
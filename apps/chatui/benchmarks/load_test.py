@@ -0,0 +1,104 @@
+"""Load test of the chat API's HTTP client against the configured backend.
+
+Runs `--sessions` concurrent chat sessions that each fetch their session `--requests` times, the call
+the UI makes on every action, once with a new client per call as before and once through the
+pooled `ChatAPI.http_client`, and reports throughput and p50/p95/p99 latency per mode. Uses the
+same settings as the app (BACKEND_TYPE=remote or agentenginerest, BACKEND_URL, ...), run it against
+a deployed TLS backend since the connection setup is what the pool saves.
+
+    uv run python -m benchmarks.load_test --sessions 100 200 --requests 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from chatui.services.chat_api import ChatAPI, get_chat_api
+from chatui.settings import get_settings
+from chatui.utils.httpx_auth import GoogleJWTAuth
+
+
+async def get_session(client: httpx.AsyncClient, chat: ChatAPI, user_id: str, session_id: str) -> httpx.Response:
+    if chat.settings.BACKEND_TYPE == "remote":
+        return await client.get(
+            f"{chat.settings.backend_url}/apps/{chat.app_name}/users/{user_id}/sessions/{session_id}"
+        )
+    return await client.post(
+        f"{chat.settings.backend_url}:query",
+        json={"class_method": "get_session", "input": {"user_id": user_id, "session_id": session_id}},
+    )
+
+
+async def per_call(chat: ChatAPI, user_id: str, session_id: str) -> httpx.Response:
+    async with httpx.AsyncClient(auth=GoogleJWTAuth(settings=chat.settings), timeout=chat.unary_timeout) as client:
+        return await get_session(client, chat, user_id, session_id)
+
+
+async def pooled(chat: ChatAPI, user_id: str, session_id: str) -> httpx.Response:
+    return await get_session(chat.http_client, chat, user_id, session_id)
+
+
+async def run_mode(name: str, call, chat: ChatAPI, sessions: list[tuple[str, str]], requests: int) -> dict:
+    latencies = []
+    errors = 0
+
+    async def session(user_id: str, session_id: str):
+        nonlocal errors
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                res = await call(chat, user_id, session_id)
+                if res.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(user_id, session_id) for user_id, session_id in sessions))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    result = {
+        "mode": name,
+        "sessions": len(sessions),
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / wall,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+    print(f"{name:>8} {len(sessions):4d} sessions: {result['requests_per_second']:8.1f} req/s  "
+          f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+          f"errors {errors}")
+    return result
+
+
+async def run(session_counts: list[int], requests: int):
+    chat = get_chat_api(get_settings())
+    if chat.settings.BACKEND_TYPE not in ("remote", "agentenginerest"):
+        raise SystemExit(f"BACKEND_TYPE={chat.settings.BACKEND_TYPE} doesn't go through the HTTP client")
+    try:
+        for count in session_counts:
+            created = await asyncio.gather(*(chat.create_session(f"load-test-{i}") for i in range(count)))
+            sessions = [(session.user_id, session.id) for session in created]
+            for name, call in [("per-call", per_call), ("pooled", pooled)]:
+                await run_mode(name, call, chat, sessions, requests)
+            await asyncio.gather(*(chat.delete_session(user_id, session_id) for user_id, session_id in sessions))
+    finally:
+        await chat.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100])
+    parser.add_argument("--requests", type=int, default=10, help="Requests per session.")
+    args = parser.parse_args()
+    asyncio.run(run(args.sessions, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Replay benchmark of the SSE event decoding in `process_streaming_query`.
+
+Replays a recorded stream, or a synthetic one with streamed text deltas, previews, a tool call and an
+inline audio event, through the previous decoding (full `Event.model_validate` and the whole dict
+logged) and through `StreamEvent`, reading the fields the UI handlers read. Reports events/sec and
+ms per stream.
+
+    uv run python -m benchmarks.sse_replay --repeat 20
+    uv run python -m benchmarks.sse_replay --record "30秒の曲を作って" --output stream.jsonl
+    uv run python -m benchmarks.sse_replay --recording stream.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from google.adk.events import Event
+from google.genai import types
+from pydantic_core import from_json
+
+from chatui.utils.events import StreamEvent
+
+logger = logging.getLogger("replay")
+logger.addHandler(logging.NullHandler())
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+def event(author: str, parts: list[types.Part], partial: bool = False) -> str:
+    """Serializes an event the way the ADK server sends it over SSE."""
+    return Event(author=author, partial=partial, content=types.Content(role="model", parts=parts)).model_dump_json(
+        exclude_none=True, by_alias=True
+    )
+
+
+def make_stream(deltas: int, audio_seconds: int) -> list[str]:
+    call = types.FunctionCall(id="call", name="LongComposerAgent", args={"request": "2分のDeep House"})
+    stream = [event("root", [types.Part(function_call=call)])]
+    stream += [event("root", [types.Part(text=f"<preview>{'0' * 32}</preview>")], partial=True) for _ in range(4)]
+    stream.append(event("root", [types.Part(function_response=types.FunctionResponse(id="call", name="LongComposerAgent", response={"result": "ok"}))]))
+    stream += [event("root", [types.Part(text="曲の説明です。" * 3)], partial=True) for _ in range(deltas)]
+    # 128 kbps MP3
+    stream.append(event("root", [types.Part.from_bytes(data=bytes(audio_seconds * 16000), mime_type="audio/mp3")]))
+    stream.append(event("root", [types.Part(text=f"{'曲の説明です。' * 3 * deltas}<artifact>{'0' * 32}</artifact>")]))
+    return stream
+
+
+def previous(payloads: list[str]) -> int:
+    touched = 0
+    for payload in payloads:
+        event_dict = from_json(payload)
+        logger.info(f"fetch event: {event_dict}")
+        validated = Event.model_validate(event_dict)
+        for part in validated.content.parts if validated.content else []:
+            if part.function_call or part.function_response:
+                touched += 1
+            if part.inline_data:
+                touched += len(part.inline_data.data)
+            if part.text:
+                touched += len(part.text)
+    return touched
+
+
+def fast_path(payloads: list[str]) -> int:
+    touched = 0
+    for payload in payloads:
+        stream_event = StreamEvent(from_json(payload))
+        logger.info(f"fetch {stream_event.summary()}")
+        for part in stream_event.parts:
+            kind = part.kind
+            if kind == "function_call":
+                touched += bool(part.function_call.name)
+            elif kind == "function_response":
+                touched += bool(part.function_response.name)
+            elif kind == "inline_data":
+                touched += len(part.inline_data.data)
+            if part.text:
+                touched += len(part.text)
+    return touched
+
+
+def run(name: str, decode, payloads: list[str], repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(payloads)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10}: {len(payloads) * repeat / elapsed:10.0f} events/s  {elapsed / repeat * 1000:8.2f} ms/stream")
+
+
+async def record(message: str, output: str):
+    from chatui.services.chat_api import get_chat_api
+    from chatui.settings import get_settings
+
+    chat = get_chat_api(get_settings())
+    try:
+        session = await chat.create_session("sse-replay")
+        with open(output, "w") as f:
+            async for event_dict in await chat.async_stream_query(message=message, user_id="sse-replay", session_id=session.id):
+                f.write(json.dumps(event_dict, ensure_ascii=False) + "\n")
+    finally:
+        await chat.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recording", help="JSONL file of event dicts, one per SSE payload.")
+    parser.add_argument("--deltas", type=int, default=300, help="Streamed text deltas of the synthetic stream.")
+    parser.add_argument("--audio-seconds", type=int, default=120, help="Length of the synthetic inline audio.")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--record", metavar="MESSAGE", help="Record the stream of MESSAGE from the configured backend.")
+    parser.add_argument("--output", default="stream.jsonl")
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record(args.record, args.output))
+        return
+
+    if args.recording:
+        with open(args.recording) as f:
+            payloads = [line for line in f if line.strip()]
+    else:
+        payloads = make_stream(args.deltas, args.audio_seconds)
+    print(f"{len(payloads)} events, {sum(len(p) for p in payloads) / 2**20:.1f}MiB")
+    assert previous(payloads) == fast_path(payloads)
+    run("previous", previous, payloads, args.repeat)
+    run("fast path", fast_path, payloads, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# (user_id, session_id, artifact_id)
+ArtifactKey = tuple[str, str, str]
+# (user_id, artifact_id): artifact ids are unique per song, so the sessions of a user share an entry
+EntryKey = tuple[str, str]
+ArtifactChunks = AsyncIterator[dict[str, Any] | bytes]
+
+
+class Audio(NamedTuple):
+    mime_type: str
+    data: bytes
+
+
+class Download:
+    """Downloads an artifact in the background for any number of readers.
+
+    The download runs at the pace of the backend rather than of the slowest reader, and every reader
+    gets the whole artifact from the start, however late it joins.
+    """
+
+    def __init__(self, chunks: ArtifactChunks):
+        self.header: dict[str, Any] | None = None
+        self.data = bytearray()
+        self.complete = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(chunks))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, chunks: ArtifactChunks):
+        try:
+            async for chunk in chunks:
+                if isinstance(chunk, dict):
+                    self.header = chunk
+                else:
+                    self.data.extend(chunk)
+                self._notify()
+            self.complete = self.header is not None
+        except Exception as e:
+            logger.warning(f"failed to download an artifact: {e}")
+        finally:
+            self._notify()
+
+    async def read(self) -> ArtifactChunks:
+        """Yields the header, then the bytes downloaded so far and the rest as it arrives."""
+        position = None
+        while True:
+            changed = self._changed
+            if position is None and self.header is not None:
+                position = 0
+                yield self.header
+            elif position is not None and len(self.data) > position:
+                chunk = bytes(self.data[position:])
+                position += len(chunk)
+                yield chunk
+            elif self.task.done():
+                return
+            else:
+                await changed.wait()
+
+
+class ArtifactCache:
+    """Process-wide cache of artifact audio, shared by the sessions of a user.
+
+    Artifacts are looked up by user, session and artifact id, and stored per user and artifact id, so any
+    session of the user that references a song gets it from the cache. Entries are kept in an LRU bounded
+    by `max_bytes`. Every artifact is downloaded once: requests for an artifact that is already being
+    downloaded read that download instead of starting their own.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.counters = collections.Counter(hits=0, misses=0, coalesced=0, prefetched=0)
+        self._cache: collections.OrderedDict[EntryKey, Audio] = collections.OrderedDict()
+        self._size = 0
+        self._downloads: dict[EntryKey, Download] = {}
+
+    @staticmethod
+    def _entry(key: ArtifactKey) -> EntryKey:
+        user_id, _, artifact_id = key
+        return user_id, artifact_id
+
+    def __contains__(self, key: ArtifactKey) -> bool:
+        """Whether the artifact is cached or being downloaded."""
+        return self._entry(key) in self._cache or self._entry(key) in self._downloads
+
+    def get(self, key: ArtifactKey) -> Audio | None:
+        key = self._entry(key)
+        audio = self._cache.get(key)
+        if audio is not None:
+            self._cache.move_to_end(key)
+        return audio
+
+    def put(self, key: ArtifactKey, audio: Audio):
+        key = self._entry(key)
+        if len(audio.data) > self.max_bytes:
+            return
+        if key in self._cache:
+            self._size -= len(self._cache.pop(key).data)
+        self._cache[key] = audio
+        self._size += len(audio.data)
+        while self._size > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._size -= len(evicted.data)
+
+    def _downloaded(self, key: ArtifactKey, download: Download):
+        if download.complete:
+            self.put(key, Audio(download.header["mime_type"], bytes(download.data)))
+        del self._downloads[self._entry(key)]
+        logger.info(f"artifact cache {dict(self.counters)}, {self._size / 2**20:.1f}MiB")
+
+    def _download(self, key: ArtifactKey, chunks: ArtifactChunks) -> Download:
+        download = self._downloads[self._entry(key)] = Download(chunks)
+        download.task.add_done_callback(lambda _: self._downloaded(key, download))
+        return download
+
+    @staticmethod
+    async def _batch_chunks(batch: asyncio.Future, key: ArtifactKey) -> ArtifactChunks:
+        audio = (await batch).get(key)
+        if audio is not None:
+            yield {"mime_type": audio.mime_type, "size": len(audio.data)}
+            yield audio.data
+
+    def prefetch(self, keys: list[ArtifactKey],
+                 fetch: Callable[[list[ArtifactKey]], Awaitable[dict[ArtifactKey, Audio | None]]]):
+        """Downloads the artifacts that are neither cached nor being downloaded with a single `fetch`, in the
+        background. Requests for them in the meantime read that download instead of starting their own."""
+        missing = [key for key in keys if key not in self]
+        if len(missing) < 2:
+            return
+        batch = asyncio.ensure_future(fetch(missing))
+        for key in missing:
+            self.counters["prefetched"] += 1
+            self._download(key, self._batch_chunks(batch, key))
+
+    async def stream(self, key: ArtifactKey, fetch: Callable[[], ArtifactChunks]) -> ArtifactChunks:
+        """Yields the artifact like `ChatAPI.stream_artifact`, calling `fetch` only when it is neither
+        cached nor being downloaded."""
+        audio = self.get(key)
+        if audio is not None:
+            self.counters["hits"] += 1
+            yield {"mime_type": audio.mime_type, "size": len(audio.data)}
+            yield audio.data
+            return
+
+        download = self._downloads.get(self._entry(key))
+        if download is not None:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            download = self._download(key, fetch())
+        async for chunk in download.read():
+            yield chunk
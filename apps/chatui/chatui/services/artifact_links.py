@@ -0,0 +1,45 @@
+import collections
+import uuid
+
+from chatui.services.artifact_cache import ArtifactKey
+
+
+class ArtifactLinks:
+    """Unguessable links to the artifacts shown in the chat, each one valid only for the Chainlit session it was
+    issued to.
+
+    A session gets one link per artifact, so the players of the events that reference the same artifact share
+    a download. At most `max_links` are kept, the least recently used are dropped first, and the links of a
+    session are dropped when it ends.
+    """
+
+    def __init__(self, max_links: int):
+        self.max_links = max_links
+        self._tokens: collections.OrderedDict[tuple[str, ArtifactKey], str] = collections.OrderedDict()
+        self._links: dict[str, tuple[str, ArtifactKey]] = {}
+
+    def token(self, chainlit_session_id: str, key: ArtifactKey) -> str:
+        """Returns the token of the link to `key` for the session, issued on first use."""
+        link = (chainlit_session_id, key)
+        token = self._tokens.get(link)
+        if token is not None:
+            self._tokens.move_to_end(link)
+            return token
+        token = self._tokens[link] = uuid.uuid4().hex
+        self._links[token] = link
+        while len(self._tokens) > self.max_links:
+            _, evicted = self._tokens.popitem(last=False)
+            del self._links[evicted]
+        return token
+
+    def resolve(self, token: str, chainlit_session_id: str) -> ArtifactKey | None:
+        """Returns the artifact of a link, None when the link doesn't exist or belongs to another session."""
+        link = self._links.get(token)
+        if link is None or link[0] != chainlit_session_id:
+            return None
+        self._tokens.move_to_end(link)
+        return link[1]
+
+    def drop_session(self, chainlit_session_id: str):
+        for link in [link for link in self._tokens if link[0] == chainlit_session_id]:
+            del self._links[self._tokens.pop(link)]
@@ -1,5 +1,7 @@
+import asyncio
+import base64
 from abc import ABC, abstractmethod
-from typing import Any, AsyncIterable, Generator
+from typing import Any, AsyncIterable, AsyncIterator, Generator
 
 import httpx
 import vertexai
@@ -11,11 +13,64 @@ from pydantic_core import from_json
 from vertexai import agent_engines
 
 from chatui.settings import Settings, get_settings
+from chatui.utils.events import ARTIFACT_INDEX_KEY
 from chatui.utils.httpx_auth import GoogleJWTAuth
 
 
 class ChatAPI(ABC):
     settings: Settings = get_settings()
+    _client: httpx.AsyncClient | None = None
+    _sync_client: httpx.Client | None = None
+
+    def _client_options(self) -> dict[str, Any]:
+        return {
+            "auth": GoogleJWTAuth(settings=self.settings),
+            "http2": self.settings.HTTP2,
+            "limits": httpx.Limits(
+                max_connections=self.settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=self.settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=self.settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "timeout": self.unary_timeout,
+        }
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """HTTP client shared by every call of this instance, so connections to the backend are reused.
+
+        HTTP/2 multiplexes concurrent requests over a single connection to TLS backends, plain HTTP
+        backends fall back to pooled HTTP/1.1 keep-alive connections. Requests use `unary_timeout`,
+        streams pass `stream_timeout`.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(**self._client_options())
+        return self._client
+
+    @property
+    def sync_http_client(self) -> httpx.Client:
+        if self._sync_client is None or self._sync_client.is_closed:
+            self._sync_client = httpx.Client(**self._client_options())
+        return self._sync_client
+
+    @property
+    def unary_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.settings.HTTP_UNARY_TIMEOUT, connect=self.settings.HTTP_CONNECT_TIMEOUT
+        )
+
+    @property
+    def stream_timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.settings.HTTP_STREAM_READ_TIMEOUT,
+            connect=self.settings.HTTP_CONNECT_TIMEOUT,
+        )
+
+    async def aclose(self) -> None:
+        """Closes the shared HTTP clients, on app shutdown."""
+        if self._client is not None:
+            await self._client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
 
     @abstractmethod
     async def get_session(self, user_id: str, session_id: str) -> Session | None:
@@ -61,25 +116,80 @@ class ChatAPI(ABC):
     ) -> types.Part:
         raise NotImplementedError("not implemented")
 
+    @abstractmethod
+    async def list_artifact_versions(
+        self, user_id: str, session_id: str, artifact_id: str
+    ) -> list[int]:
+        """Returns the versions of an artifact, without loading it. Empty when the artifact doesn't exist."""
+        raise NotImplementedError("not implemented")
+
+    async def load_artifacts(
+        self, user_id: str, session_id: str, artifact_ids: list[str]
+    ) -> dict[str, types.Part | None]:
+        """Loads several artifacts, by id. Backends without a batch operation load them concurrently."""
+        artifacts = await asyncio.gather(
+            *(
+                self.load_artifact(user_id=user_id, session_id=session_id, artifact_id=artifact_id)
+                for artifact_id in artifact_ids
+            )
+        )
+        return {
+            artifact_id: types.Part.model_validate(artifact) if artifact else None
+            for artifact_id, artifact in zip(artifact_ids, artifacts)
+        }
+
+    async def list_artifact_metadata(
+        self, user_id: str, session_id: str
+    ) -> dict[str, dict[str, Any]]:
+        """Returns the size, duration, codec, creation time and hash of the songs in a session, by id."""
+        session = await self.get_session(user_id=user_id, session_id=session_id)
+        if session is None:
+            return {}
+        return session.state.get(ARTIFACT_INDEX_KEY) or {}
+
+    async def stream_artifact(
+        self, user_id: str, session_id: str, artifact_id: str
+    ) -> AsyncIterator[dict[str, Any] | bytes]:
+        """Yields a header with the artifact's `mime_type` and `size`, then its bytes in chunks.
+
+        Nothing is yielded when the artifact doesn't exist. Backends without a streaming operation
+        load the artifact whole and yield it as a single chunk.
+        """
+        artifact = await self.load_artifact(
+            user_id=user_id, session_id=session_id, artifact_id=artifact_id
+        )
+        if artifact is None:
+            return
+        artifact = types.Part.model_validate(artifact)
+        yield {
+            "mime_type": artifact.inline_data.mime_type,
+            "size": len(artifact.inline_data.data),
+        }
+        yield artifact.inline_data.data
+
+
+def decode_artifact_chunk(chunk: dict[str, Any]) -> dict[str, Any] | bytes:
+    """Turns an item of the `stream_artifact` operation into the header dict or the decoded bytes."""
+    if "data" in chunk:
+        return base64.b64decode(chunk["data"])
+    return chunk
+
 
 class VertexAIRESTChatAPI(ChatAPI):
     async def __async_query(
         self, *, method: str, user_id: str, session_id: str = None, **kwargs
     ):
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=600
-        ) as client:
-            param = {
-                "user_id": user_id,
-                "session_id": session_id,
-            }
+        param = {
+            "user_id": user_id,
+            "session_id": session_id,
+        }
 
-            if kwargs:
-                param.update(kwargs)
+        if kwargs:
+            param.update(kwargs)
 
-            data = {"class_method": method, "input": param}
-            res = await client.post(f"{self.settings.backend_url}:query", json=data)
-            return res
+        data = {"class_method": method, "input": param}
+        res = await self.http_client.post(f"{self.settings.backend_url}:query", json=data)
+        return res
 
     async def get_session(self, user_id: str, session_id: str) -> Session | None:
         res = await self.__async_query(
@@ -116,6 +226,67 @@ class VertexAIRESTChatAPI(ChatAPI):
         else:
             return types.Part.model_validate(res.json())
 
+    async def list_artifact_versions(
+        self, user_id: str, session_id: str, artifact_id: str
+    ) -> list[int]:
+        res = await self.__async_query(
+            method="list_artifact_versions",
+            user_id=user_id,
+            session_id=session_id,
+            artifact_id=artifact_id,
+        )
+        res.raise_for_status()
+        return res.json()["output"]
+
+    async def load_artifacts(
+        self, user_id: str, session_id: str, artifact_ids: list[str]
+    ) -> dict[str, types.Part | None]:
+        res = await self.__async_query(
+            method="load_artifacts",
+            user_id=user_id,
+            session_id=session_id,
+            artifact_ids=artifact_ids,
+        )
+        res.raise_for_status()
+        return {
+            artifact_id: types.Part.model_validate(artifact) if artifact else None
+            for artifact_id, artifact in res.json()["output"].items()
+        }
+
+    async def list_artifact_metadata(
+        self, user_id: str, session_id: str
+    ) -> dict[str, dict[str, Any]]:
+        res = await self.__async_query(
+            method="list_artifact_metadata",
+            user_id=user_id,
+            session_id=session_id,
+        )
+        res.raise_for_status()
+        return res.json()["output"]
+
+    async def stream_artifact(
+        self, user_id: str, session_id: str, artifact_id: str
+    ) -> AsyncIterator[dict[str, Any] | bytes]:
+        async with self.http_client.stream(
+            "POST",
+            f"{self.settings.backend_url}:streamQuery",
+            json={
+                "class_method": "stream_artifact",
+                "input": {
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "artifact_id": artifact_id,
+                },
+            },
+            timeout=self.stream_timeout,
+        ) as res:
+            if res.status_code != 200:
+                return
+            # One JSON object per line, each chunk is decoded as soon as its line arrives.
+            async for line in res.aiter_lines():
+                if line.strip():
+                    yield decode_artifact_chunk(from_json(line))
+
     async def create_session(
         self,
         user_id: str,
@@ -146,31 +317,29 @@ class VertexAIRESTChatAPI(ChatAPI):
         streaming=False,
         **kwargs,
     ) -> Generator[dict[str, Any], None, None]:
-        with httpx.Client(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=None
-        ) as client:
-            new_message = types.UserContent(parts=[types.Part(text=message)])
-
-            with connect_sse(
-                client,
-                "POST",
-                url=f"{self.settings.backend_url}:streamQuery?alt=sse",
-                params={"alt": "sse"},
-                json={
-                    "class_method": "stream_query",
-                    "input": {
-                        "user_id": user_id,
-                        "session_id": session_id,
-                        "message": new_message.to_json_dict(),
-                    },
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "text/event-stream",
+        new_message = types.UserContent(parts=[types.Part(text=message)])
+
+        with connect_sse(
+            self.sync_http_client,
+            "POST",
+            url=f"{self.settings.backend_url}:streamQuery?alt=sse",
+            params={"alt": "sse"},
+            json={
+                "class_method": "stream_query",
+                "input": {
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "message": new_message.to_json_dict(),
                 },
-            ) as event_source:
-                for sse in event_source.iter_sse():
-                    yield from_json(sse.data)
+            },
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            timeout=self.stream_timeout,
+        ) as event_source:
+            for sse in event_source.iter_sse():
+                yield from_json(sse.data)
 
     async def async_stream_query(
         self,
@@ -187,47 +356,42 @@ class VertexAIRESTChatAPI(ChatAPI):
         else:
             new_message = message
 
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings),
-            timeout=None,
-        ) as client:
-            async with aconnect_sse(
-                client,
-                "POST",
-                url=f"{self.settings.backend_url}:streamQuery?alt=sse",
-                params={"alt": "sse"},
-                json={
-                    "class_method": "async_stream_query",
-                    "input": {
-                        "user_id": user_id,
-                        "session_id": session_id,
-                        "message": new_message.to_json_dict(),
-                    },
-                },
-                headers={
-                    "Content-Type": "application/json",
+        async with aconnect_sse(
+            self.http_client,
+            "POST",
+            url=f"{self.settings.backend_url}:streamQuery?alt=sse",
+            params={"alt": "sse"},
+            json={
+                "class_method": "async_stream_query",
+                "input": {
+                    "user_id": user_id,
+                    "session_id": session_id,
+                    "message": new_message.to_json_dict(),
                 },
-            ) as event_source:
-                content_type = event_source.response.headers.get(
-                    "content-type", ""
-                ).partition(";")[0]
-
-                print(event_source.response.headers.get("content-type", ""))
-
-                if "text/event-stream" not in content_type:
-                    text = await event_source.response.aread()
-                    yield from_json(text)
-                    return
-                    # decoder = SSEDecoder()
-                    # async for line in event_source.response.aiter_lines():
-                    #     line = line.rstrip("\n")
-                    #     sse = decoder.decode(line)
-                    #     if sse is not None:
-                    #         yield from_json(sse.data)
-                    # return
-
-                async for sse in event_source.aiter_sse():
-                    yield from_json(sse.data)
+            },
+            headers={
+                "Content-Type": "application/json",
+            },
+            timeout=self.stream_timeout,
+        ) as event_source:
+            content_type = event_source.response.headers.get(
+                "content-type", ""
+            ).partition(";")[0]
+
+            if "text/event-stream" not in content_type:
+                text = await event_source.response.aread()
+                yield from_json(text)
+                return
+                # decoder = SSEDecoder()
+                # async for line in event_source.response.aiter_lines():
+                #     line = line.rstrip("\n")
+                #     sse = decoder.decode(line)
+                #     if sse is not None:
+                #         yield from_json(sse.data)
+                # return
+
+            async for sse in event_source.aiter_sse():
+                yield from_json(sse.data)
 
 
 class VertexAIChatAPI(ChatAPI):
@@ -262,6 +426,39 @@ class VertexAIChatAPI(ChatAPI):
             user_id=user_id, session_id=session_id, artifact_id=artifact_id
         )
 
+    async def list_artifact_versions(
+        self, user_id: str, session_id: str, artifact_id: str
+    ) -> list[int]:
+        return await self.app.list_artifact_versions(
+            user_id=user_id, session_id=session_id, artifact_id=artifact_id
+        )
+
+    async def load_artifacts(
+        self, user_id: str, session_id: str, artifact_ids: list[str]
+    ) -> dict[str, types.Part | None]:
+        artifacts = await self.app.load_artifacts(
+            user_id=user_id, session_id=session_id, artifact_ids=artifact_ids
+        )
+        return {
+            artifact_id: types.Part.model_validate(artifact) if artifact else None
+            for artifact_id, artifact in artifacts.items()
+        }
+
+    async def list_artifact_metadata(
+        self, user_id: str, session_id: str
+    ) -> dict[str, dict[str, Any]]:
+        return await self.app.list_artifact_metadata(
+            user_id=user_id, session_id=session_id
+        )
+
+    async def stream_artifact(
+        self, user_id: str, session_id: str, artifact_id: str
+    ) -> AsyncIterator[dict[str, Any] | bytes]:
+        async for chunk in self.app.stream_artifact(
+            user_id=user_id, session_id=session_id, artifact_id=artifact_id
+        ):
+            yield decode_artifact_chunk(chunk)
+
     async def create_session(
         self,
         user_id: str,
@@ -311,57 +508,49 @@ class RemoteChatAPI(ChatAPI):
         super().__init__()
 
     async def get_session(self, user_id: str, session_id: str) -> Session | None:
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=600
-        ) as client:
-            res = await client.get(
-                f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}"
-            )
-            if res.status_code != 200:
-                return None
-            else:
-                return Session.model_validate(res.json())
+        res = await self.http_client.get(
+            f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}"
+        )
+        if res.status_code != 200:
+            return None
+        else:
+            return Session.model_validate(res.json())
 
     async def delete_session(self, user_id: str, session_id: str) -> None:
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=600
-        ) as client:
-            res = await client.delete(
-                f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}"
-            )
-            res.raise_for_status()
+        res = await self.http_client.delete(
+            f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}"
+        )
+        res.raise_for_status()
 
     async def list_sessions(self, user_id: str) -> list[Session]:
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=600
-        ) as client:
-            res = await client.get(
-                f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions"
-            )
-            return [Session.model_validate(j) for j in res.json()]
+        res = await self.http_client.get(
+            f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions"
+        )
+        return [Session.model_validate(j) for j in res.json()]
 
     async def create_session(
         self, user_id: str, state: dict[str, Any] | None = None
     ) -> Session:
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=600
-        ) as client:
-            res = await client.post(
-                f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions",
-                json={"state": state},
-            )
-            return Session.model_validate(res.json())
+        res = await self.http_client.post(
+            f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions",
+            json={"state": state},
+        )
+        return Session.model_validate(res.json())
 
     async def load_artifact(self, user_id: str, session_id: str, artifact_id: str):
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=600
-        ) as client:
-            res = await client.get(
-                f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}/artifacts/{artifact_id}"
-            )
-            if "detail" in res.json() and res.json()["detail"] == "Artifact not found":
-                return None
-            return types.Part.model_validate(res.json())
+        res = await self.http_client.get(
+            f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}/artifacts/{artifact_id}"
+        )
+        if "detail" in res.json() and res.json()["detail"] == "Artifact not found":
+            return None
+        return types.Part.model_validate(res.json())
+
+    async def list_artifact_versions(self, user_id: str, session_id: str, artifact_id: str) -> list[int]:
+        res = await self.http_client.get(
+            f"{self.settings.backend_url}/apps/{self.app_name}/users/{user_id}/sessions/{session_id}/artifacts/{artifact_id}/versions"
+        )
+        res.raise_for_status()
+        return res.json()
 
     def stream_query(
         self,
@@ -371,29 +560,27 @@ class RemoteChatAPI(ChatAPI):
         streaming=False,
         **kwargs,
     ) -> Generator[dict[str, Any], None, None]:
-        with httpx.Client(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=None
-        ) as client:
-            new_message = types.UserContent(parts=[types.Part(text=message)])
-
-            with connect_sse(
-                client,
-                "POST",
-                f"{self.settings.backend_url}/run_sse",
-                json={
-                    "app_name": self.app_name,
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "new_message": new_message.to_json_dict(),
-                    "streaming": streaming,
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "text/event-stream",
-                },
-            ) as event_source:
-                for sse in event_source.iter_sse():
-                    yield from_json(sse.data)
+        new_message = types.UserContent(parts=[types.Part(text=message)])
+
+        with connect_sse(
+            self.sync_http_client,
+            "POST",
+            f"{self.settings.backend_url}/run_sse",
+            json={
+                "app_name": self.app_name,
+                "user_id": user_id,
+                "session_id": session_id,
+                "new_message": new_message.to_json_dict(),
+                "streaming": streaming,
+            },
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            timeout=self.stream_timeout,
+        ) as event_source:
+            for sse in event_source.iter_sse():
+                yield from_json(sse.data)
 
     async def async_stream_query(
         self,
@@ -410,28 +597,25 @@ class RemoteChatAPI(ChatAPI):
         else:
             new_message = message
 
-        async with httpx.AsyncClient(
-            auth=GoogleJWTAuth(settings=self.settings), timeout=None
-        ) as client:
-            async with aconnect_sse(
-                client,
-                "POST",
-                f"{self.settings.backend_url}/run_sse",
-                json={
-                    "app_name": self.app_name,
-                    "user_id": user_id,
-                    "session_id": session_id,
-                    "new_message": new_message.to_json_dict(),
-                    "streaming": streaming,
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Accept": "text/event-stream",
-                },
-            ) as event_source:
-                async for sse in event_source.aiter_sse():
-                    print(sse.data)
-                    yield from_json(sse.data)
+        async with aconnect_sse(
+            self.http_client,
+            "POST",
+            f"{self.settings.backend_url}/run_sse",
+            json={
+                "app_name": self.app_name,
+                "user_id": user_id,
+                "session_id": session_id,
+                "new_message": new_message.to_json_dict(),
+                "streaming": streaming,
+            },
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            timeout=self.stream_timeout,
+        ) as event_source:
+            async for sse in event_source.aiter_sse():
+                yield from_json(sse.data)
 
 
 def get_chat_api(settings: Settings = Depends(get_settings)) -> ChatAPI:
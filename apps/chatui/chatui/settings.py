@@ -12,6 +12,25 @@ class Settings(BaseSettings):
     BACKEND_URL: str|None = 'http://localhost:8000'
     GOOGLE_CLOUD_AGENT_ENGINE_ID: str|None = None
     CHAINLIT_AUTH_SECRET: str|None = None
+    # Shared HTTP client of the chat API, see ChatAPI.http_client
+    HTTP2: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60
+    HTTP_CONNECT_TIMEOUT: float = 10
+    HTTP_UNARY_TIMEOUT: float = 600
+    # Between two events of a stream, None waits as long as the backend takes
+    HTTP_STREAM_READ_TIMEOUT: float|None = None
+    # Decoded artifact audio kept in memory by the UI, shared by all sessions
+    ARTIFACT_CACHE_MB: int = 128
+    # Links to the artifacts shown in the chat kept by the UI, the least recently used are dropped first
+    ARTIFACT_LINKS_MAX: int = 10000
+    # Streamed tokens are sent to the browser in one frame per interval or size, see TokenBuffer
+    RENDER_FLUSH_INTERVAL_MS: int = 50
+    RENDER_FLUSH_BYTES: int = 1024
+    # Polling of the preview the composer saves while its tool call runs, 0 disables it. Only useful when the
+    # agent saves previews, see LONG_COMPOSER_PREVIEW_SECONDS
+    PREVIEW_POLL_SECONDS: float = 0
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,116 @@
+import functools
+import re
+from typing import Any
+
+from google.genai import types
+
+ARTIFACT_TAG = re.compile(r"<(artifact|preview)>")
+# State key of the metadata the agent keeps of every song in the session, by artifact id
+ARTIFACT_INDEX_KEY = "artifact_index"
+
+
+def field(raw: dict[str, Any], name: str, alias: str) -> Any:
+    """Reads a field of an event dict, dumped in snake case by Agent Engine and in camel case by the ADK server."""
+    value = raw.get(name)
+    return raw.get(alias) if value is None else value
+
+
+class StreamPart:
+    """A part of a streamed event that validates only the fields the UI reads, when it reads them.
+
+    Text stays the plain string of the payload, and the base64 of inline data is only decoded when
+    `inline_data` is read.
+    """
+
+    def __init__(self, raw: dict[str, Any]):
+        self.raw = raw
+
+    @property
+    def text(self) -> str | None:
+        return self.raw.get("text")
+
+    @property
+    def thought(self) -> bool:
+        return bool(self.raw.get("thought"))
+
+    @functools.cached_property
+    def function_call(self) -> types.FunctionCall | None:
+        value = field(self.raw, "function_call", "functionCall")
+        return types.FunctionCall.model_validate(value) if value is not None else None
+
+    @functools.cached_property
+    def function_response(self) -> types.FunctionResponse | None:
+        value = field(self.raw, "function_response", "functionResponse")
+        return types.FunctionResponse.model_validate(value) if value is not None else None
+
+    @functools.cached_property
+    def inline_data(self) -> types.Blob | None:
+        value = field(self.raw, "inline_data", "inlineData")
+        return types.Blob.model_validate(value) if value is not None else None
+
+    @property
+    def kind(self) -> str:
+        """Classifies the part from the keys of the payload, without validating it."""
+        if field(self.raw, "function_call", "functionCall") is not None:
+            return "function_call"
+        if field(self.raw, "function_response", "functionResponse") is not None:
+            return "function_response"
+        if field(self.raw, "inline_data", "inlineData") is not None:
+            return "inline_data"
+        text = self.text
+        if text is None:
+            return "other"
+        if self.thought:
+            return "thought"
+        tag = ARTIFACT_TAG.search(text)
+        return tag.group(1) if tag else "text"
+
+    def summary(self) -> str:
+        kind = self.kind
+        if kind in ("text", "thought", "artifact", "preview"):
+            return f"{kind}({len(self.text)} chars)"
+        if kind == "inline_data":
+            blob = field(self.raw, "inline_data", "inlineData")
+            # Base64 takes 4 characters per 3 bytes.
+            size = len(blob.get("data") or "") * 3 // 4
+            return f"inline_data({field(blob, 'mime_type', 'mimeType')}, {size / 1024:.0f}KiB)"
+        if kind == "function_call":
+            return f"function_call({field(self.raw, 'function_call', 'functionCall').get('name')})"
+        if kind == "function_response":
+            return f"function_response({field(self.raw, 'function_response', 'functionResponse').get('name')})"
+        return kind
+
+
+class StreamEvent:
+    """Cheap view of an event dict from the chat API, in place of a full `Event.model_validate`."""
+
+    def __init__(self, raw: dict[str, Any]):
+        self.raw = raw
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.raw.get("partial"))
+
+    @functools.cached_property
+    def parts(self) -> list[StreamPart]:
+        content = self.raw.get("content") or {}
+        return [StreamPart(part) for part in content.get("parts") or []]
+
+    @property
+    def state_delta(self) -> dict[str, Any]:
+        actions = self.raw.get("actions") or {}
+        return field(actions, "state_delta", "stateDelta") or {}
+
+    def summary(self) -> str:
+        """Describes the event for the logs without its payload, which can be megabytes of base64 audio."""
+        actions = self.raw.get("actions") or {}
+        deltas = [
+            name
+            for name, alias in (("state_delta", "stateDelta"), ("artifact_delta", "artifactDelta"))
+            if field(actions, name, alias)
+        ]
+        return (
+            f"event {self.raw.get('id')} from {self.raw.get('author')}"
+            f"{' partial' if self.partial else ''}: [{', '.join(part.summary() for part in self.parts)}]"
+            f"{' ' + ', '.join(deltas) if deltas else ''}"
+        )
@@ -1,38 +1,132 @@
+import asyncio
+import logging
+import threading
+import time
 import typing
+from datetime import timezone
 
 import google.auth
+import google.auth.jwt
 import google.oauth2.credentials
 import google.oauth2.id_token
 import httpx
+from google.auth.credentials import Credentials
 from google.auth.transport.requests import Request as AuthRequest
 from httpx import Request, Response
 
 from chatui.settings import Settings
 
+# Tokens are refreshed in the background once they have less than this left, and synchronously once expired.
+REFRESH_MARGIN_SECONDS = 300
+# Assumed lifetime of a token that doesn't say when it expires.
+DEFAULT_LIFETIME_SECONDS = 600
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """Process-wide cache of the application default credentials and their tokens, per audience.
+
+    The access token is cached under the `None` audience, ID tokens under the URL they are for. Fetching
+    a token is a blocking network call, so the async path runs it in a thread, with at most one
+    refresh per audience in flight: concurrent requests wait for it instead of starting their own.
+    """
+
+    def __init__(self, margin: float = REFRESH_MARGIN_SECONDS):
+        self.margin = margin
+        self._credentials: Credentials | None = None
+        self._tokens: dict[str | None, tuple[str, float]] = {}
+        self._refreshes: dict[str | None, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, audience: str | None) -> tuple[str, float]:
+        with self._lock:
+            if self._credentials is None:
+                self._credentials, _ = google.auth.default()
+            credentials = self._credentials
+            if audience is None or isinstance(credentials, google.oauth2.credentials.Credentials):
+                # User credentials carry an ID token for the gcloud client, refreshed along with the access token.
+                credentials.refresh(AuthRequest())
+                if audience is None:
+                    expiry = credentials.expiry.replace(tzinfo=timezone.utc).timestamp() if credentials.expiry else None
+                    token = credentials.token
+                else:
+                    token = credentials.id_token
+                    expiry = None
+            else:
+                # Service accounts, e.g. on Cloud Run, mint ID tokens for the audience.
+                token = google.oauth2.id_token.fetch_id_token(AuthRequest(), audience)
+                expiry = None
+            if expiry is None and audience is not None:
+                expiry = google.auth.jwt.decode(token, verify=False).get("exp")
+            expiry = expiry or time.time() + DEFAULT_LIFETIME_SECONDS
+            self._tokens[audience] = (token, expiry)
+            logger.info(f"refreshed the token for {audience or 'access'}, expires in {expiry - time.time():.0f}s")
+            return token, expiry
+
+    def _refresh(self, audience: str | None) -> asyncio.Task:
+        task = self._refreshes.get(audience)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(asyncio.to_thread(self._fetch, audience))
+            task.add_done_callback(self._refreshed)
+            self._refreshes[audience] = task
+        return task
+
+    @staticmethod
+    def _refreshed(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"failed to refresh a token: {task.exception()}")
+
+    async def token(self, audience: str | None = None) -> str:
+        cached = self._tokens.get(audience)
+        now = time.time()
+        if cached is not None and cached[1] > now:
+            if cached[1] - now < self.margin:
+                self._refresh(audience)
+            return cached[0]
+        token, _ = await asyncio.shield(self._refresh(audience))
+        return token
+
+    def sync_token(self, audience: str | None = None) -> str:
+        cached = self._tokens.get(audience)
+        if cached is not None and cached[1] - time.time() > self.margin:
+            return cached[0]
+        token, _ = self._fetch(audience)
+        return token
+
+    def invalidate(self, audience: str | None = None):
+        self._tokens.pop(audience, None)
+
+
+tokens = TokenCache()
+
 
 class GoogleJWTAuth(httpx.Auth):
-    def __init__(self, settings: Settings):
+    """Authorizes requests with a cached Google ID token for remote backends and an access token otherwise.
+
+    A request rejected with 401 is retried once with a freshly fetched token.
+    """
+
+    def __init__(self, settings: Settings, cache: TokenCache = tokens):
         self.settings = settings
+        self.cache = cache
+
+    @property
+    def audience(self) -> str | None:
+        return self.settings.BACKEND_URL if self.settings.BACKEND_TYPE == "remote" else None
+
+    def sync_auth_flow(self, request: Request) -> typing.Generator[Request, Response, None]:
+        request.headers["Authorization"] = f"Bearer {self.cache.sync_token(self.audience)}"
+        response = yield request
+        if response.status_code == 401:
+            self.cache.invalidate(self.audience)
+            request.headers["Authorization"] = f"Bearer {self.cache.sync_token(self.audience)}"
+            yield request
 
-    def auth_flow(self, request: Request) -> typing.Generator[Request, Response, None]:
-        creds, _ = google.auth.default()
-
-        creds.refresh(AuthRequest())
-        if isinstance(creds, google.oauth2.credentials.Credentials):
-            creds.apply(
-                request.headers,
-                creds.id_token
-                if self.settings.BACKEND_TYPE == "remote"
-                else creds.token,
-            )
-        else:
-            # maybe run on cloud run
-            auth_req = (
-                google.auth.transport.requests.Request()
-            )  # ty: ignore[unresolved-attribute]
-            aud = self.settings.BACKEND_URL
-            id_token = google.oauth2.id_token.fetch_id_token(auth_req, aud)
-            request.headers["Authorization"] = (
-                f"Bearer {id_token if self.settings.BACKEND_TYPE == 'remote' else creds.token}"
-            )
-        yield request
\ No newline at end of file
+    async def async_auth_flow(self, request: Request) -> typing.AsyncGenerator[Request, Response]:
+        request.headers["Authorization"] = f"Bearer {await self.cache.token(self.audience)}"
+        response = yield request
+        if response.status_code == 401:
+            self.cache.invalidate(self.audience)
+            request.headers["Authorization"] = f"Bearer {await self.cache.token(self.audience)}"
+            yield request
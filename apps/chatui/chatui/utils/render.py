@@ -0,0 +1,82 @@
+import asyncio
+import weakref
+
+import chainlit as cl
+
+
+class TokenBuffer:
+    """Coalesces the tokens streamed to a message into one frame per `interval` seconds or `max_bytes`.
+
+    Every `Message.stream_token` is a websocket frame, so tokens are held until the oldest pending one is
+    `interval` old or they add up to `max_bytes`, whichever comes first, and sent as a single token.
+    """
+
+    def __init__(self, message: cl.Message, interval: float, max_bytes: int):
+        self.message = message
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self._pending: list[str] = []
+        self._size = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    async def write(self, token: str):
+        if not token:
+            return
+        self._pending.append(token)
+        self._size += len(token.encode())
+        if self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        task = asyncio.create_task(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self):
+        """Sends the pending tokens now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._pending:
+                return
+            token = "".join(self._pending)
+            self._pending.clear()
+            self._size = 0
+            await self.message.stream_token(token)
+
+    async def finalize(self, content: str):
+        """Brings the message to its final `content` and ends its stream, in a single update.
+
+        Chainlit can't end a stream without the whole message: `update()` sends the full step, content
+        included. Tokens still pending are dropped rather than sent, as that update carries them anyway.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            self._pending.clear()
+            self._size = 0
+            self.message.content = content
+            await self.message.update()
+
+
+_buffers: weakref.WeakKeyDictionary[cl.Message, TokenBuffer] = weakref.WeakKeyDictionary()
+
+
+def token_buffer(message: cl.Message, interval: float, max_bytes: int) -> TokenBuffer:
+    """Returns the buffer of the message, created on first use."""
+    if message not in _buffers:
+        _buffers[message] = TokenBuffer(message, interval, max_bytes)
+    return _buffers[message]
+
+
+async def flush_tokens(message: cl.Message | None):
+    """Sends the tokens pending on the message, before anything else is rendered."""
+    if message is not None and message in _buffers:
+        await _buffers[message].flush()
@@ -1,3 +1,4 @@
+import asyncio
 import re
 import sys
 import uuid
@@ -5,13 +6,20 @@ import logging
 from typing import Any
 
 import chainlit as cl
-from google.adk.events import Event
+from chainlit.server import UserParam, app
+from chainlit.session import WebsocketSession
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from google.genai import types
-from pydantic.v1 import ValidationError
+from pydantic import ValidationError
 
 from chatui.schema.state import State
+from chatui.services.artifact_cache import ArtifactCache, Audio
+from chatui.services.artifact_links import ArtifactLinks
 from chatui.services.chat_api import get_chat_api
 from chatui.settings import get_settings
+from chatui.utils.events import ARTIFACT_INDEX_KEY, StreamEvent
+from chatui.utils.render import flush_tokens, token_buffer
 
 from engineio.payload import Payload
 import dotenv
@@ -33,6 +41,51 @@ tool_name_map = {
     "LongComposerAgent": "作曲エージェント"
 }
 
+# Tools that save previews while they run, see poll_preview
+preview_tools = {"LongComposerFlowAgent"}
+
+# Links to the artifacts shown in the chat, the audio player streams them from the route below.
+artifact_links = ArtifactLinks(SETTINGS.ARTIFACT_LINKS_MAX)
+artifact_cache = ArtifactCache(SETTINGS.ARTIFACT_CACHE_MB * 2**20)
+
+@app.get("/artifacts/{token}/audio.mp3")
+async def stream_artifact(token: str, session_id: str, current_user: UserParam):
+    """Streams an artifact to the browser while it is still being fetched from the backend.
+
+    Like the files of a Chainlit session, a link is only served to the session it was issued to, and to the
+    user of that session when login is required.
+    """
+    session = WebsocketSession.get_by_id(session_id)
+    key = artifact_links.resolve(token, session_id) if session else None
+    if key is None or (current_user and (not session.user or session.user.identifier != current_user.identifier)):
+        raise HTTPException(status_code=404)
+    user_id, chat_session_id, artifact_id = key
+
+    chunks = artifact_cache.stream(
+        key,
+        lambda: chat.stream_artifact(user_id=user_id, session_id=chat_session_id, artifact_id=artifact_id),
+    )
+    header = await anext(chunks, None)
+    if header is None:
+        raise HTTPException(status_code=404)
+    return StreamingResponse(chunks, media_type=header["mime_type"], headers={"Content-Length": str(header["size"])})
+
+# Chainlit serves its frontend from a catch-all route, so the artifact route has to come before it.
+app.router.routes.insert(0, app.router.routes.pop())
+
+@cl.on_app_shutdown
+async def close_chat_api():
+    await chat.aclose()
+
+@cl.on_chat_end
+async def drop_artifact_links():
+    artifact_links.drop_session(cl.context.session.id)
+
+def artifact_url(state, artifact_id: str) -> str:
+    session_id = cl.context.session.id
+    token = artifact_links.token(session_id, (state.user_id, state.session_id, artifact_id))
+    return f"/artifacts/{token}/audio.mp3?session_id={session_id}"
+
 @cl.set_starters
 async def set_starters():
     return [
@@ -108,7 +161,9 @@ async def setup():
     state_dict = cl.user_session.get('state', {})
     state = State.model_validate(state_dict)
     if state.user_id is None:
-        state.user_id = uuid.uuid4().hex
+        # A logged in user keeps their id across tabs, so their sessions share the artifact cache.
+        user = cl.user_session.get("user")
+        state.user_id = user.identifier if user else uuid.uuid4().hex
 
     session = await chat.create_session(state.user_id)
     state.session_id = session.id
@@ -147,17 +202,34 @@ async def handle_error(event_dict):
         return True
     return False
 
+def prefetch_artifacts(state, artifact_ids: list[str]):
+    """Starts loading the artifacts of an event in one request, instead of one per player."""
+    async def load(keys):
+        artifacts = await chat.load_artifacts(
+            user_id=state.user_id, session_id=state.session_id, artifact_ids=[key[2] for key in keys]
+        )
+        return {
+            key: Audio(artifact.inline_data.mime_type, artifact.inline_data.data)
+            for key in keys
+            if (artifact := artifacts.get(key[2])) is not None and artifact.inline_data
+        }
+
+    artifact_cache.prefetch([(state.user_id, state.session_id, artifact_id) for artifact_id in artifact_ids], load)
+
 async def process_artifacts(part, state, partial_msg=None):
     """Process artifacts in event content."""
     elements = []
-    if part.text and SETTINGS.BACKEND_TYPE == "agentengine" and "<artifact>" in part.text:
+    if part.text and "<artifact>" in part.text:
         logger.info("found the artifact")
         artifacts = re.findall(r"<artifact>(.+?)</artifact>", part.text)
+        prefetch_artifacts(state, artifacts)
+        # Metadata of the songs, from the state deltas streamed so far
+        index = cl.user_session.get("artifact_index") or {}
         for artifact in artifacts:
-            mp3file_dict = await chat.load_artifact(user_id=state.user_id, session_id=state.session_id,
-                                                    artifact_id=artifact)
-            artifact = types.Part.model_validate(mp3file_dict)
-            elements.append(cl.Audio(name="audio.mp3", display="inline", content=artifact.inline_data.data))
+            seconds = round((index.get(artifact) or {}).get("duration_seconds") or 0)
+            name = f"audio.mp3 ({seconds // 60}:{seconds % 60:02d})" if seconds else "audio.mp3"
+            # The player fetches the song from a URL, so it can start before the whole file is downloaded.
+            elements.append(cl.Audio(name=name, display="inline", url=artifact_url(state, artifact), mime="audio/mpeg"))
 
     if not elements:
         return partial_msg, elements
@@ -171,8 +243,91 @@ async def process_artifacts(part, state, partial_msg=None):
 
     return partial_msg, elements
 
+async def process_preview(part, state, partial_msg=None):
+    """Render the preview of a song that is still being generated in place of the previous one."""
+    if not (part.text and "<preview>" in part.text):
+        return partial_msg, False
+
+    artifact_id = re.search(r"<preview>(.+?)</preview>", part.text).group(1)
+    # Every preview is a new version of the song's artifact, so they are loaded directly and never cached.
+    preview_dict = await chat.load_artifact(user_id=state.user_id, session_id=state.session_id, artifact_id=artifact_id)
+    if preview_dict is None:
+        return partial_msg, True
+
+    preview = types.Part.model_validate(preview_dict)
+    elements = [cl.Audio(name="preview.mp3", display="inline", content=preview.inline_data.data)]
+    if partial_msg is None:
+        partial_msg = cl.Message(content="", elements=elements)
+        await partial_msg.send()
+    else:
+        partial_msg.elements = elements
+        await partial_msg.update()
+
+    return partial_msg, True
+
+def preview_artifact_id(function_call_id: str) -> str:
+    """The artifact the composer agent saves the previews of a tool call to, named after the function call."""
+    return f"preview-{function_call_id}"
+
+async def poll_preview(state, function_call_id: str):
+    """Shows the preview of a song while the tool call generating it runs, each one in place of the previous one.
+
+    The composer runs as a tool, whose events never reach the UI, so its previews are polled from the artifacts.
+    The preview is removed when the polling is cancelled, as the song itself follows.
+    """
+    preview_msg = None
+    version = None
+    artifact_id = preview_artifact_id(function_call_id)
+    try:
+        while True:
+            await asyncio.sleep(SETTINGS.PREVIEW_POLL_SECONDS)
+            try:
+                # Only the version list goes over the wire until there is a new preview to download.
+                versions = await chat.list_artifact_versions(
+                    user_id=state.user_id, session_id=state.session_id, artifact_id=artifact_id
+                )
+                if not versions or max(versions) == version:
+                    continue
+                preview_dict = await chat.load_artifact(
+                    user_id=state.user_id, session_id=state.session_id, artifact_id=artifact_id
+                )
+            except Exception as e:
+                logger.warning(f"failed to load the preview of {function_call_id}: {e}")
+                continue
+            if preview_dict is None:
+                continue
+            version = max(versions)
+            preview = types.Part.model_validate(preview_dict)
+            elements = [cl.Audio(name="preview.mp3", display="inline", content=preview.inline_data.data)]
+            if preview_msg is None:
+                preview_msg = cl.Message(content="", elements=elements)
+                await preview_msg.send()
+            else:
+                preview_msg.elements = elements
+                await preview_msg.update()
+    finally:
+        if preview_msg is not None:
+            await preview_msg.remove()
+
+async def stop_preview(poll: asyncio.Task | None):
+    if poll is not None:
+        poll.cancel()
+        await asyncio.gather(poll, return_exceptions=True)
+
+def tokens_of(message):
+    return token_buffer(message, SETTINGS.RENDER_FLUSH_INTERVAL_MS / 1000, SETTINGS.RENDER_FLUSH_BYTES)
+
 async def handle_partial_event(part, state, partial_msg):
     """Handle partial events from the chat API."""
+    # Anything else rendered into the message goes after the text streamed so far
+    if part.kind not in ("text", "thought"):
+        await flush_tokens(partial_msg)
+
+    # Previews replace each other and carry no text to stream
+    partial_msg, is_preview = await process_preview(part, state, partial_msg)
+    if is_preview:
+        return partial_msg
+
     # Process artifacts in partial event
     partial_msg, _ = await process_artifacts(part, state, partial_msg)
 
@@ -182,7 +337,7 @@ async def handle_partial_event(part, state, partial_msg):
             partial_msg = cl.Message(content=part.text)
             await partial_msg.send()
         else:
-            await partial_msg.stream_token(part.text)
+            await tokens_of(partial_msg).write(part.text)
 
     # Handle inline data in partial event
     if part.inline_data:
@@ -229,11 +384,9 @@ async def handle_inline_data(part, partial_msg):
 
 async def handle_text_content(part, partial_msg):
     """Handle text content events from the chat API."""
-    logger.info(f"update content {part.text}")
     if partial_msg:
-        logger.info("update partial msg")
-        partial_msg.content = part.text
-        await partial_msg.update()
+        logger.info(f"finalize partial msg, {len(part.text)} chars")
+        await tokens_of(partial_msg).finalize(part.text)
         return None
     else:
         logger.info("send new message")
@@ -258,43 +411,61 @@ async def process_streaming_query(
         partial_msg=None,
 ):
     current_tool = None
+    # Preview polls of the running tool calls, by function call id
+    preview_polls: dict[str, asyncio.Task] = {}
 
     res = await chat.async_stream_query(message=content, user_id=state.user_id, session_id=state.session_id)
-    async for event_dict in res:
-        logging.info(f"fetch event: {event_dict}")
-
-        # Handle errors
-        if await handle_error(event_dict):
-            return
-
-        try:
-            event = Event.model_validate(event_dict)
-        except ValidationError as e:
-            cl.context.emitter.send_toast(message=f"Got Error: {e}, {event_dict}", type="error")
-            return
-
-        # Handle partial events
-        if event.partial:
-            for part in event.content.parts:
-                partial_msg = await handle_partial_event(part, state, partial_msg)
-            continue
-
-        for part in event.content.parts:
-            # Handle function calls
-            if part.function_call and not part.function_response:
-                current_tool = await handle_function_call(part, current_tool)
-
-            # Handle function responses
-            if part.function_response:
-                current_tool = await handle_function_response(part, current_tool)
-
-            # Handle inline data
-            if part.inline_data:
-                partial_msg = await handle_inline_data(part, partial_msg)
-
-            # Process artifacts
-            partial_msg, _ = await process_artifacts(part, state, partial_msg)
-
-            # Handle text content
-            if part.text:
-                partial_msg = await handle_text_content(part, partial_msg)
+    try:
+        async for event_dict in res:
+            event = StreamEvent(event_dict)
+            logger.info(f"fetch {event.summary()}")
+            if ARTIFACT_INDEX_KEY in event.state_delta:
+                cl.user_session.set("artifact_index", event.state_delta[ARTIFACT_INDEX_KEY])
+
+            # Handle errors
+            if await handle_error(event_dict):
+                return
+
+            # Parts are validated lazily, as the handlers read their fields
+            try:
+                # Handle partial events
+                if event.partial:
+                    for part in event.parts:
+                        partial_msg = await handle_partial_event(part, state, partial_msg)
+                    continue
+
+                await flush_tokens(partial_msg)
+                for part in event.parts:
+                    kind = part.kind
+
+                    # Handle function calls
+                    if kind == "function_call":
+                        current_tool = await handle_function_call(part, current_tool)
+                        fc = part.function_call
+                        if fc.name in preview_tools and SETTINGS.PREVIEW_POLL_SECONDS:
+                            preview_polls[fc.id] = asyncio.create_task(poll_preview(state, fc.id))
+
+                    # Handle function responses
+                    if kind == "function_response":
+                        await stop_preview(preview_polls.pop(part.function_response.id, None))
+                        current_tool = await handle_function_response(part, current_tool)
+
+                    # Handle inline data
+                    if kind == "inline_data":
+                        partial_msg = await handle_inline_data(part, partial_msg)
+
+                    # Process artifacts
+                    if kind == "artifact":
+                        partial_msg, _ = await process_artifacts(part, state, partial_msg)
+
+                    # Handle text content
+                    if part.text:
+                        partial_msg = await handle_text_content(part, partial_msg)
+            except ValidationError as e:
+                cl.context.emitter.send_toast(message=f"Got Error: {e}, {event.summary()}", type="error")
+                return
+    finally:
+        # Tokens still pending when the stream ends or fails
+        await flush_tokens(partial_msg)
+        for poll in preview_polls.values():
+            await stop_preview(poll)